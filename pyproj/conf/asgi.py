@@ -3,6 +3,12 @@ ASGI config for a Django project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the project with an ASGI server (eg: uvicorn or daphne) to get the
+/api/events push channel: under ASGI each open event stream is a parked
+coroutine, whereas under WSGI it would hold a worker thread for its lifetime.
+The session endpoints and /api/people are async views too, so the many
+tabs polling them don't each take a thread from the sync_to_async pool.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -1,16 +1,32 @@
 import zoneinfo
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
 from django.utils import timezone
 
 
 class TimezoneMiddleware(object):
+    # Async-capable so that async views under ASGI don't get pushed onto a thread
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Built once rather than on every request
+        self.zone = zoneinfo.ZoneInfo(settings.TIME_ZONE) if settings.TIME_ZONE else None
 
-    def __call__(self, request):
-        tzname = settings.TIME_ZONE
-        if tzname:
-            timezone.activate(zoneinfo.ZoneInfo(tzname))
+    def activate(self):
+        if self.zone:
+            timezone.activate(self.zone)
 
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.activate()
         return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.activate()
+        return await self.get_response(request)
@@ -50,14 +50,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'spreadui.middleware.MetricsMiddleware',
+    'spreadui.middleware.ApiGZipMiddleware',
+    'spreadui.middleware.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
+    # The FastPath versions are skipped for SPREADUI_FAST_PATHS, the status and change polls
+    'spreadui.middleware.FastPathCommonMiddleware',
+    'spreadui.middleware.FastPathCsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'login_required.middleware.LoginRequiredMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'spreadui.middleware.FastPathMessageMiddleware',
+    'spreadui.middleware.FastPathXFrameOptionsMiddleware',
     'conf.middleware.TimezoneMiddleware',
 ]
 
@@ -86,6 +90,9 @@ WSGI_APPLICATION = 'conf.wsgi.application'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 # Moved to local_settings.py
 
+# Sends reads of people to SPREADUI_READ_REPLICAS, if any are configured
+DATABASE_ROUTERS = ['spreadui.routers.ReplicaRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -215,4 +222,8 @@ if DEBUG:
     else:
         INSTALLED_APPS.append('debug_toolbar')
         INSTALLED_APPS.append('django_extensions')
-        MIDDLEWARE.insert(0, 'debug_toolbar.middleware.DebugToolbarMiddleware')
+        # After GZip, so the toolbar can inject itself into uncompressed pages
+        MIDDLEWARE.insert(
+            MIDDLEWARE.index('spreadui.middleware.ApiGZipMiddleware') + 1,
+            'debug_toolbar.middleware.DebugToolbarMiddleware',
+        )
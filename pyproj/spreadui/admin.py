@@ -1,12 +1,62 @@
+from datetime import timedelta
+
 from django.contrib import admin
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.utils import timezone
+
+from .locks import SESSION_TIMEOUT
 from .models import Person, EditingSession
+from .pagination import EstimatedCountPaginator
+from .search import filter_people
+
+
+class AgeRangeFilter(admin.SimpleListFilter):
+    """Filters on age ranges, which use the age index, rather than listing every distinct age"""
+
+    title = 'age'
+    parameter_name = 'age'
+    RANGES = {
+        'under-18': ('Under 18', None, 18),
+        '18-29': ('18–29', 18, 30),
+        '30-44': ('30–44', 30, 45),
+        '45-64': ('45–64', 45, 65),
+        '65-plus': ('65+', 65, None),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(key, label) for key, (label, _, _) in self.RANGES.items()]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.RANGES:
+            return queryset
+        _, low, high = self.RANGES[self.value()]
+        if low is not None:
+            queryset = queryset.filter(age__gte=low)
+        if high is not None:
+            queryset = queryset.filter(age__lt=high)
+        return queryset
 
 
 @admin.register(Person)
 class PersonAdmin(admin.ModelAdmin):
     list_display = ['first_name', 'last_name', 'email', 'age', 'created_at']
-    list_filter = ['age', 'created_at']
+    list_filter = [AgeRangeFilter, 'created_at']
     search_fields = ['first_name', 'last_name', 'email']
+    date_hierarchy = 'created_at'
+    # Newest first, and only sortable by indexed columns.  The admin adds -pk as
+    # a tie-breaker, so a descending sort walks a (column, id) index backwards;
+    # an ascending one is (column ASC, id DESC), which the index only gives in
+    # column order, leaving the database to sort rows that tie
+    ordering = ['-id']
+    sortable_by = ['first_name', 'last_name', 'email', 'age', 'created_at']
+    # Don't COUNT(*) the table twice per page: estimate the total, and skip
+    # the unfiltered count shown next to a filtered one
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index rather than icontains scans over search_fields
+        return filter_people(queryset, search_term), False
 
 
 @admin.register(EditingSession)
@@ -16,8 +66,14 @@ class EditingSessionAdmin(admin.ModelAdmin):
     search_fields = ['uuid']
     readonly_fields = ['uuid', 'created_at']
 
+    def get_queryset(self, request):
+        cutoff = timezone.now() - timedelta(seconds=SESSION_TIMEOUT)
+        active = ExpressionWrapper(Q(last_keepalive__gt=cutoff), output_field=BooleanField())
+        return super().get_queryset(request).annotate(active=active)
+
     def is_active(self, obj):
-        return obj.is_active()
+        return obj.active
 
     is_active.boolean = True
     is_active.short_description = 'Active'
+    is_active.admin_order_field = 'active'
@@ -1,15 +1,70 @@
-from ninja import NinjaAPI, Schema
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags
+from ninja import File, Form, NinjaAPI, Schema, UploadedFile
+from ninja.errors import HttpError
 from typing import List, Optional
-from django.utils import timezone
-from django.db.models.functions import Now
-from .models import Person, EditingSession
-
-api = NinjaAPI()
-
-
-def cleanup_expired_sessions():
-    """Clean up expired editing sessions (older than 30 seconds)"""
-    EditingSession.objects.filter(last_keepalive__lt=Now() - timezone.timedelta(seconds=30)).delete()
+from .cache import apeople_version, people_cache_key, people_version, response_cache, response_timeout
+from .columns import parse_fields, person_columns
+from .edits import EDITABLE_FIELDS, bulk_update_people, clean_patch, update_person_fields
+from .events import broadcaster, format_event, publish_leases, publish_rows, publish_session
+from .filters import apply_tabulator_filters, parse_tabulator_params, tabulator_sort
+from .importer import import_people, read_rows
+from .leases import (
+    acquire_lease,
+    aextend_leases,
+    alease_holders,
+    aothers_hold_leases,
+    arelease_leases,
+    extend_leases,
+    lease_holders,
+    leased_ranges,
+)
+from .locks import SESSION_TIMEOUT, get_lock_backend
+from .metrics import record_lock_event
+from .models import Person
+from .pagination import DEFAULT_PAGE_SIZE, keyset_page, parse_sort, sorted_queryset
+from .renderers import get_renderer
+from .search import DEFAULT_SEARCH_SIZE, search_people
+from .streaming import (
+    DEFAULT_CHUNK_SIZE,
+    PERSON_FIELDS,
+    csv_chunks,
+    iter_rows,
+    json_array_chunks,
+    ndjson_chunks,
+    streaming_content,
+)
+from .sync import apeople_etag, changes_since, issue_watermark, parse_watermark
+from .xlsx import xlsx_chunks
+
+api = NinjaAPI(renderer=get_renderer())
+
+
+def render(request, data):
+    """
+    Render data as the API would, for responses that are built or cached as bytes.
+
+    This skips the per-row validation Ninja gives responses with a schema, so
+    only use it for trusted data, such as values() rows of PERSON_FIELDS.
+    """
+    content = api.renderer.render(request, data, response_status=200)
+    return content if isinstance(content, bytes) else content.encode()
+
+
+def etag_matches(request, etag):
+    """
+    Whether If-None-Match names etag.
+
+    The comparison is weak, as RFC 9110 asks: ApiGZipMiddleware sends
+    compressed responses with a W/ ETag, which browsers send back.
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in parse_etags(if_none_match)]
 
 
 class PersonSchema(Schema):
@@ -20,11 +75,55 @@ class PersonSchema(Schema):
     age: int
 
 
+class PersonRowSchema(Schema):
+    """A row with only the columns named by fields=; id is always sent"""
+
+    id: int
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+    age: Optional[int] = None
+
+
+class PersonPageSchema(Schema):
+    data: List[PersonRowSchema]
+    next_cursor: Optional[str] = None
+
+
+class ColumnSchema(Schema):
+    field: str
+    title: str
+    type: str
+    editable: bool
+    sortable: bool
+    filter: Optional[str] = None
+
+
+class PersonSearchSchema(Schema):
+    data: List[PersonSchema]
+    page: int
+    has_more: bool
+
+
+class PersonChangesSchema(Schema):
+    watermark: str
+    changed: List[PersonSchema]
+    deleted: List[int]
+    reset: bool = False
+
+
+class LeaseSchema(Schema):
+    first_id: int
+    last_id: int
+    holder: str
+
+
 class SessionStatusSchema(Schema):
     can_edit: bool
     current_editor: Optional[str] = None
     time_remaining: Optional[int] = None
     session_id: Optional[str] = None
+    leases: List[LeaseSchema] = []
 
 
 class PersonUpdateSchema(Schema):
@@ -35,84 +134,412 @@ class PersonUpdateSchema(Schema):
     age: int
 
 
-@api.get("/people", response=List[PersonSchema])
-def list_people(request):
-    return Person.objects.all()
+@api.get("/people", response=List[PersonRowSchema])
+async def list_people(request, fields: Optional[str] = None):
+    """Every person, with only the columns named in fields (comma-separated) if it is given"""
+    fields = projected_fields(fields)
+    cache = response_cache()
+    key = people_cache_key(await apeople_version(), request)
+    cached = await cache.aget(key)
+    if cached is None:
+        etag = await apeople_etag()
+        rows = [row async for row in Person.objects.values(*fields)]
+        cached = (etag, render(request, rows))
+        await cache.aset(key, cached, response_timeout())
+    etag, body = cached
+
+    if etag_matches(request, etag):
+        return HttpResponseNotModified(headers={"ETag": etag})
+    return HttpResponse(body, content_type=api.get_content_type(), headers={"ETag": etag})
+
+
+@api.get("/people/columns", response=List[ColumnSchema])
+def list_people_columns(request):
+    """The sheet's columns: their titles, types, and whether they can be edited, sorted and filtered"""
+    return person_columns()
+
+
+@api.get("/people/changes", response=PersonChangesSchema)
+def list_people_changes(request, since: Optional[str] = None):
+    """
+    Rows changed and deleted since a watermark issued by an earlier call.
+
+    Called without since, this just issues a watermark to start syncing from.
+    """
+    if since is None:
+        return {"watermark": issue_watermark(), "changed": [], "deleted": []}
+
+    try:
+        since = parse_watermark(since)
+    except ValueError as e:
+        raise HttpError(400, str(e))
+
+    watermark, changed, deleted, reset = changes_since(since)
+    return {"watermark": watermark, "changed": changed, "deleted": deleted, "reset": reset}
+
+
+def filtered_people(request, sort):
+    """
+    The people matching the request's Tabulator filters, and the sort key to
+    use: the request's Tabulator sorters if any, otherwise sort.
+    """
+    sorters, filters = parse_tabulator_params(request.GET)
+    try:
+        return apply_tabulator_filters(Person.objects.all(), filters), tabulator_sort(sorters, default=sort)
+    except ValueError as e:
+        raise HttpError(400, str(e))
+
+
+def projected_fields(fields):
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HttpError(400, str(e))
+
+
+def sorted_people(request, sort):
+    """The people matching the request's Tabulator filters, in the order of its sorters (or sort)"""
+    queryset, sort = filtered_people(request, sort)
+    try:
+        return sorted_queryset(queryset, sort)
+    except ValueError as e:
+        raise HttpError(400, str(e))
+
+
+@api.get("/people/page", response=PersonPageSchema)
+def list_people_page(
+    request,
+    after: Optional[str] = None,
+    size: int = DEFAULT_PAGE_SIZE,
+    sort: str = "id",
+    fields: Optional[str] = None,
+):
+    """
+    One page of people, continuing after the cursor returned with the previous page.
+
+    Also accepts Tabulator's remote sort[i][...] and filter[i][...] parameters,
+    and fields, as for /people.
+    """
+    fields = projected_fields(fields)
+    cache = response_cache()
+    key = people_cache_key(people_version(), request)
+    body = cache.get(key)
+    if body is None:
+        queryset, sort = filtered_people(request, sort)
+        try:
+            # The next cursor is made from the sort column, so select it even if it isn't sent
+            sort_field, _ = parse_sort(sort)
+            selected = fields if sort_field in fields else (*fields, sort_field)
+            rows, next_cursor = keyset_page(queryset.values(*selected), sort=sort, after=after, size=size)
+        except ValueError as e:
+            raise HttpError(400, str(e))
+        if selected != fields:
+            for row in rows:
+                del row[sort_field]
+        body = render(request, {"data": rows, "next_cursor": next_cursor})
+        cache.set(key, body, response_timeout())
+    return HttpResponse(body, content_type=api.get_content_type())
+
+
+@api.get("/people/search", response=PersonSearchSchema)
+def search_people_page(request, q: str, page: int = 1, size: int = DEFAULT_SEARCH_SIZE):
+    """One page of the people whose names or email match every word of q, best matches first"""
+    try:
+        rows, has_more = search_people(q, page=page, size=size)
+    except ValueError as e:
+        raise HttpError(400, str(e))
+    return {"data": rows, "page": page, "has_more": has_more}
+
+
+@api.get("/people/stream")
+def stream_people(
+    request, format: str = "json", chunk_size: int = DEFAULT_CHUNK_SIZE, sort: str = "id", fields: Optional[str] = None
+):
+    """
+    The whole table as a streamed JSON array (format=json) or NDJSON (format=ndjson),
+    with only the columns in fields if it is given.
+
+    Rows go straight from the database cursor to the client without building
+    model instances or schemas, so memory use stays flat however big the table is.
+    """
+    fields = projected_fields(fields)
+    chunk_size = max(1, min(chunk_size, 10000))
+    rows = iter_rows(sorted_people(request, sort), fields=fields, chunk_size=chunk_size)
+    if format == "ndjson":
+        chunks, content_type = ndjson_chunks(rows, fields=fields, batch=chunk_size), "application/x-ndjson"
+    elif format == "json":
+        chunks, content_type = json_array_chunks(rows, fields=fields, batch=chunk_size), "application/json"
+    else:
+        raise HttpError(400, f"Unknown format {format!r}")
+    return StreamingHttpResponse(streaming_content(request, chunks), content_type=content_type)
+
+
+@api.get("/people/export")
+def export_people(request, format: str = "csv", sort: str = "id"):
+    """
+    Download the sheet as CSV (format=csv) or XLSX (format=xlsx), with the
+    same Tabulator sort and filter parameters as /people/page.
+
+    The file is streamed from a database cursor as it is encoded, so neither
+    memory use nor the time to the first byte grows with the size of the table.
+    """
+    rows = iter_rows(sorted_people(request, sort))
+    if format == "csv":
+        chunks, content_type = csv_chunks(rows), "text/csv; charset=utf-8"
+    elif format == "xlsx":
+        chunks = xlsx_chunks(rows, PERSON_FIELDS, sheet_name="People")
+        content_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        raise HttpError(400, f"Unknown format {format!r}")
+    response = StreamingHttpResponse(streaming_content(request, chunks), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="people.{format}"'
+    # Pass chunks on as they come rather than buffering the whole download in nginx
+    response["X-Accel-Buffering"] = "no"
+    return response
 
 
 class SessionRequestSchema(Schema):
     uuid: str
 
 
-@api.get("/session/status", response=SessionStatusSchema)
-def get_session_status(request, uuid: str):
-    # Clean up expired sessions
-    cleanup_expired_sessions()
+class LeaseRequestSchema(Schema):
+    uuid: str
+    first_id: int
+    last_id: int
+
+
+def editable_ids(uuid, ids):
+    """
+    Work out which of ids uuid may change, extending its editing lock or
+    leases.  Returns (allowed_ids, holds_lock); allowed_ids is None if uuid
+    holds neither the lock nor any lease.
+    """
+    if get_lock_backend().keepalive(uuid):
+        return set(ids), True
+    if not extend_leases(uuid):
+        return None, False
+    ranges = leased_ranges(uuid)
+    return {i for i in ids if any(first_id <= i <= last_id for first_id, last_id in ranges)}, False
+
+
+async def current_session_event():
+    """The session message a newly connected event stream starts with"""
+    holder, time_remaining = await get_lock_backend().astatus()
+    return format_event(
+        "session", {"current_editor": holder[:8] + "..." if holder else None, "time_remaining": time_remaining}
+    )
+
+
+@api.get("/events")
+async def stream_events(request):
+    """
+    Server-Sent Events stream of lock changes ("session") and row edits ("rows").
+
+    Served from the ASGI application, where each open stream is a parked
+    coroutine rather than a thread, so idle viewers cost next to nothing.
+    Under WSGI a stream would hold a worker thread for as long as the tab is
+    open, so there this answers 204, which stops EventSource reconnecting;
+    the sheet then falls back to polling.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    initial = await current_session_event()
+    response = StreamingHttpResponse(broadcaster.subscribe([initial]), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+# The session endpoints are async: under ASGI the many tabs polling them
+# wait on the event loop instead of each holding a thread.
 
-    active_session = EditingSession.objects.first()
 
-    if active_session:
-        time_remaining = 30 - (timezone.now() - active_session.last_keepalive).seconds
+@api.get("/session/status", response=SessionStatusSchema)
+async def get_session_status(request, uuid: str):
+    holder, time_remaining = await get_lock_backend().astatus()
+    leases = await alease_holders()
 
+    if holder:
         # Check if the current request is from the active editor
-        is_current_editor = uuid == active_session.uuid
+        is_current_editor = uuid == holder
 
         return {
             "can_edit": is_current_editor,
-            "current_editor": active_session.uuid[:8] + "...",
-            "time_remaining": max(0, time_remaining),
-            "session_id": active_session.uuid if is_current_editor else None,
+            "current_editor": holder[:8] + "...",
+            "time_remaining": time_remaining,
+            "session_id": holder if is_current_editor else None,
+            "leases": leases,
         }
     else:
-        return {"can_edit": True, "current_editor": None, "time_remaining": None, "session_id": None}
+        return {"can_edit": True, "current_editor": None, "time_remaining": None, "session_id": None, "leases": leases}
 
 
 @api.post("/session/keepalive")
-def keepalive_session(request, data: SessionRequestSchema):
+async def keepalive_session(request, data: SessionRequestSchema):
     """Keepalive endpoint - polled regularly to detect client disappearance"""
-    try:
-        session = EditingSession.objects.get(uuid=data.uuid)
-        session.last_keepalive = timezone.now()
-        session.save()
+    if await get_lock_backend().akeepalive(data.uuid):
+        publish_session(data.uuid, SESSION_TIMEOUT)
         return {"success": True}
-    except EditingSession.DoesNotExist:
-        return {"success": False, "message": "Invalid session"}
+    if await aextend_leases(data.uuid):
+        return {"success": True}
+    record_lock_event("sheet", "expired")
+    return {"success": False, "message": "Invalid session"}
 
 
 @api.post("/session/edit")
-def edit_session(request, data: SessionRequestSchema):
+async def edit_session(request, data: SessionRequestSchema):
     """Edit endpoint - called for user actions to grant/extend editing time"""
-    # Clean up expired sessions
-    cleanup_expired_sessions()
-
-    # Check if this user already has an active session
-    try:
-        session = EditingSession.objects.get(uuid=data.uuid)
-        # User is the current editor - extend editing time
-        session.last_keepalive = timezone.now()
-        session.save()
-        return {"success": True, "can_edit": True}
-    except EditingSession.DoesNotExist:
-        # User doesn't have a session - check if they can claim one
-        active_session = EditingSession.objects.first()
-        if active_session:
-            # Someone else is editing
-            return {"success": False, "can_edit": False, "message": "Someone else is currently editing"}
-        else:
-            # No one is editing - create session for this user
-            session = EditingSession.objects.create(uuid=data.uuid)
-            return {"success": True, "can_edit": True}
+    leased = {"success": False, "can_edit": False, "message": "Someone else is editing some rows"}
+    if await aothers_hold_leases(data.uuid):
+        record_lock_event("sheet", "denied")
+        return leased
+    backend = get_lock_backend()
+    if not await backend.aacquire(data.uuid):
+        # Someone else is editing
+        record_lock_event("sheet", "denied")
+        return {"success": False, "can_edit": False, "message": "Someone else is currently editing"}
+    # A lease may have been granted while the lock was claimed; see spreadui.leases
+    if await aothers_hold_leases(data.uuid):
+        await backend.arelease(data.uuid)
+        record_lock_event("sheet", "denied")
+        return leased
+    record_lock_event("sheet", "acquired")
+    publish_session(data.uuid, SESSION_TIMEOUT)
+    return {"success": True, "can_edit": True}
 
 
 @api.post("/session/end")
-def end_editing_session(request, data: SessionRequestSchema):
-    try:
-        session = EditingSession.objects.get(uuid=data.uuid)
-        session.delete()
+async def end_editing_session(request, data: SessionRequestSchema):
+    released = await get_lock_backend().arelease(data.uuid)
+    if released:
+        record_lock_event("sheet", "released")
+        publish_session(None)
+    if await arelease_leases(data.uuid):
+        record_lock_event("rows", "released")
+        publish_leases(await alease_holders())
+        released = True
+    if released:
         return {"success": True}
-    except EditingSession.DoesNotExist:
+    return {"success": False, "message": "Invalid session"}
+
+
+@api.post("/session/lease")
+def lease_rows(request, data: LeaseRequestSchema):
+    """Lease rows first_id..last_id, so that they can be edited while others edit elsewhere"""
+    if data.first_id > data.last_id:
+        return {"success": False, "message": "first_id is after last_id"}
+    if not acquire_lease(data.uuid, data.first_id, data.last_id):
+        record_lock_event("rows", "denied")
+        return {"success": False, "message": "Someone else is editing these rows"}
+    record_lock_event("rows", "acquired")
+    publish_leases(lease_holders())
+    return {"success": True}
+
+
+# The import response lists at most this many rejected rows
+MAX_REPORTED_REJECTS = 100
+
+
+class ImportRejectSchema(Schema):
+    line: int
+    error: str
+
+
+class PeopleImportResponseSchema(Schema):
+    success: bool
+    message: Optional[str] = None
+    processed: int = 0
+    created: int = 0
+    updated: int = 0
+    rejected: int = 0
+    rejects: List[ImportRejectSchema] = []
+
+
+@api.post("/people/import", response=PeopleImportResponseSchema)
+def import_people_file(request, uuid: str = Form(...), file: UploadedFile = File(...)):
+    """
+    Import people from an uploaded CSV or XLSX file, for the holder of the editing lock.
+
+    The upload is parsed as a stream and saved in batches, extending the lock
+    after each one.  Rows that can't be imported are counted, and the first
+    MAX_REPORTED_REJECTS of them are returned with the reason.
+    """
+    backend = get_lock_backend()
+    holder, _ = backend.status()
+    if holder != uuid:
+        return {"success": False, "message": "You must be editing to import"}
+
+    rejects = []
+
+    def reject(line, values, error):
+        if len(rejects) < MAX_REPORTED_REJECTS:
+            rejects.append({"line": line, "error": error})
+
+    try:
+        result = import_people(
+            read_rows(file, file.name), reject=reject, progress=lambda result: backend.keepalive(uuid)
+        )
+    except ValueError as e:
+        raise HttpError(400, str(e))
+    publish_session(uuid, SESSION_TIMEOUT)
+    return {"success": True, **vars(result), "rejects": rejects}
+
+
+class PersonPatchSchema(Schema):
+    id: int
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+    age: Optional[int] = None
+
+
+class PeopleBulkUpdateRequestSchema(Schema):
+    uuid: str
+    rows: List[PersonPatchSchema]
+
+
+class RowResultSchema(Schema):
+    id: int
+    success: bool
+    message: Optional[str] = None
+
+
+class PeopleBulkUpdateResponseSchema(Schema):
+    success: bool
+    message: Optional[str] = None
+    results: List[RowResultSchema] = []
+
+
+@api.post("/people/bulk", response=PeopleBulkUpdateResponseSchema)
+def bulk_update_rows(request, data: PeopleBulkUpdateRequestSchema):
+    """Apply a batch of row patches (eg: a paste, or edits made in quick succession) in one transaction"""
+    # Later patches to the same row win
+    patches = {}
+    for row in data.rows:
+        # A null is kept, to be refused, rather than silently leaving the cell unchanged
+        patch = row.model_dump(exclude_unset=True)
+        patches.setdefault(patch.pop("id"), {}).update(patch)
+
+    # Verify session is valid, extending it
+    allowed, holds_lock = editable_ids(data.uuid, patches)
+    if allowed is None:
         return {"success": False, "message": "Invalid session"}
 
+    refused = [
+        {"id": person_id, "success": False, "message": "Row is not leased to you"}
+        for person_id in patches
+        if person_id not in allowed
+    ]
+    results, changed_rows = bulk_update_people({k: v for k, v in patches.items() if k in allowed})
+    results = refused + results
+
+    if changed_rows:
+        publish_rows(changed_rows)
+    if holds_lock:
+        publish_session(data.uuid, SESSION_TIMEOUT)
+    return {"success": all(result["success"] for result in results), "results": results}
+
 
 class PersonUpdateRequestSchema(Schema):
     uuid: str
@@ -124,28 +551,46 @@ class PersonUpdateRequestSchema(Schema):
 
 @api.put("/people/{person_id}")
 def update_person(request, person_id: int, data: PersonUpdateRequestSchema):
-    # Verify session is valid
-    try:
-        session = EditingSession.objects.get(uuid=data.uuid)
-        if not session.is_active():
-            session.delete()
-            return {"success": False, "message": "Session expired"}
-    except EditingSession.DoesNotExist:
+    return save_person_patch(person_id, data.uuid, data.model_dump(include=set(EDITABLE_FIELDS)))
+
+
+class PersonPatchRequestSchema(Schema):
+    uuid: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+    age: Optional[int] = None
+
+
+@api.patch("/people/{person_id}")
+def patch_person(request, person_id: int, data: PersonPatchRequestSchema):
+    """Change only the fields given; unchanged values are not written"""
+    patch = data.model_dump(exclude_unset=True)
+    patch.pop("uuid")
+    return save_person_patch(person_id, data.uuid, patch)
+
+
+def save_person_patch(person_id, uuid, patch):
+    # Verify session is valid, extending it
+    allowed, holds_lock = editable_ids(uuid, [person_id])
+    if allowed is None:
         return {"success": False, "message": "Invalid session"}
+    if person_id not in allowed:
+        return {"success": False, "message": "Row is not leased to you"}
 
-    # Update person
     try:
-        person = Person.objects.get(id=person_id)
-        person.first_name = data.first_name
-        person.last_name = data.last_name
-        person.email = data.email
-        person.age = data.age
-        person.save()
+        patch = clean_patch(patch)
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
 
-        # Update keepalive
-        session.last_keepalive = timezone.now()
-        session.save()
-
-        return {"success": True}
+    # Update person
+    try:
+        person, changed = update_person_fields(person_id, patch)
     except Person.DoesNotExist:
         return {"success": False, "message": "Person not found"}
+
+    if changed:
+        publish_rows([{field: getattr(person, field) for field in PERSON_FIELDS}])
+    if holds_lock:
+        publish_session(uuid, SESSION_TIMEOUT)
+    return {"success": True, "changed": changed}
@@ -0,0 +1,109 @@
+"""
+Helpers shared by the benchmark management commands: counting queries,
+collecting latencies from several threads, and reporting percentiles.
+"""
+
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+
+# Statements that are transaction bookkeeping rather than real queries
+TRANSACTION_CONTROL = re.compile(r"^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE SAVEPOINT)\b", re.IGNORECASE)
+
+
+class QueryCounter:
+    """Counts the statements run on this thread's connection, leaving out transaction control"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not TRANSACTION_CONTROL.match(sql):
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+def percentile(values, fraction):
+    """The nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class Timings:
+    """Latency and query count samples per label, recorded from any thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(list)
+
+    def record(self, label, seconds, queries=None):
+        with self._lock:
+            self._samples[label].append((seconds, queries))
+
+    @contextmanager
+    def measure(self, label, count=True):
+        """Time the block, and count its queries if count is True"""
+        started = time.perf_counter()
+        if count:
+            with count_queries() as counter:
+                yield
+            self.record(label, time.perf_counter() - started, counter.count)
+        else:
+            yield
+            self.record(label, time.perf_counter() - started)
+
+    def summary(self, elapsed):
+        """One dict per label with its request count, p50/p99 in ms, requests per second and queries per request"""
+        rows = []
+        with self._lock:
+            samples = {label: list(values) for label, values in self._samples.items()}
+        for label, values in sorted(samples.items()):
+            latencies = sorted(seconds for seconds, _ in values)
+            queries = [q for _, q in values if q is not None]
+            rows.append(
+                {
+                    "label": label,
+                    "requests": len(values),
+                    "p50": percentile(latencies, 0.50) * 1000,
+                    "p99": percentile(latencies, 0.99) * 1000,
+                    "rps": len(values) / elapsed if elapsed else 0,
+                    "queries": sum(queries) / len(queries) if queries else None,
+                }
+            )
+        return rows
+
+
+def format_summary(rows):
+    """Lay out Timings.summary() as a text table"""
+    width = max([len(row["label"]) for row in rows] + [8])
+    lines = [f'{"endpoint":<{width}}  {"requests":>8}  {"p50 ms":>8}  {"p99 ms":>8}  {"req/s":>8}  {"queries":>7}']
+    for row in rows:
+        queries = f'{row["queries"]:.1f}' if row["queries"] is not None else "-"
+        lines.append(
+            f'{row["label"]:<{width}}  {row["requests"]:>8}  {row["p50"]:>8.1f}  {row["p99"]:>8.1f}  '
+            f'{row["rps"]:>8.1f}  {queries:>7}'
+        )
+    return "\n".join(lines)
+
+
+def local_client(user):
+    """A test Client logged in as user, addressed to a host the settings allow"""
+    hosts = [host.lstrip(".") for host in settings.ALLOWED_HOSTS if host != "*"]
+    client = Client(HTTP_HOST=hosts[0] if hosts else "localhost")
+    client.force_login(user)
+    return client
@@ -0,0 +1,107 @@
+"""
+A cache of rendered people responses, keyed on a table version counter.
+
+Every change to the Person table bumps the version: post_save and
+post_delete do it through signals, and bulk writes (which send no signals)
+call bump_people_version() themselves.  Cache keys include the version, so
+a bump retires every cached response at once without deleting anything;
+stale entries simply expire.  Repeat loads of an unchanged table are then
+served from pre-rendered bytes with no queries at all.
+
+The version lives in the cache named by SPREADUI_RESPONSE_CACHE (default
+"default").  locmem is fine for one process; with several worker processes
+use a shared cache such as Redis, or each worker will only see its own
+bumps.
+"""
+
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .routers import read_replicas, reads_from_primary, sticky_seconds
+
+VERSION_KEY = "spreadui:people-version"
+
+# Cached responses are dropped this long after they were rendered, so old
+# versions don't linger in caches without an eviction policy
+RESPONSE_TIMEOUT = 300
+
+
+def response_timeout():
+    """
+    How long to keep a rendered response.
+
+    A response rendered from a lagging replica just after a bump holds rows
+    older than its version, so with replicas it is only kept for as long as
+    the replicas are allowed to lag.
+    """
+    if read_replicas():
+        return min(RESPONSE_TIMEOUT, sticky_seconds())
+    return RESPONSE_TIMEOUT
+
+
+def response_cache():
+    return caches[getattr(settings, "SPREADUI_RESPONSE_CACHE", "default")]
+
+
+def _initial_version():
+    # Time-based, so a cache that lost the counter doesn't restart it at a
+    # number that older, still-cached responses were rendered under
+    return time.time_ns()
+
+
+def people_version():
+    cache = response_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _initial_version(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def apeople_version():
+    cache = response_cache()
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, _initial_version(), None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def _bump():
+    cache = response_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, _initial_version(), None)
+
+
+def bump_people_version():
+    """
+    Retire all cached people responses.
+
+    Bumps now, so the writer's own next read isn't served from the cache, and
+    again when the transaction commits, in case another request cached the
+    pre-commit rows under the first bump.
+    """
+    _bump()
+    transaction.on_commit(_bump)
+
+
+def people_cache_key(version, request):
+    """
+    A cache key for the response to request at a table version.
+
+    Responses read from replicas are cached apart from those read from the
+    primary: one rendered from a lagging replica just after a bump holds
+    older rows than its version, and a client that has just written must
+    not be served it.
+    """
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    digest = hashlib.sha1(f"{request.path}?{query}".encode()).hexdigest()
+    source = "primary" if reads_from_primary() else "replica"
+    return f"spreadui:people:{version}:{source}:{digest}"
@@ -0,0 +1,53 @@
+"""
+The sheet's columns: metadata the browser builds its table from, and the
+fields= projection that lets it ask for only the columns it shows.
+
+A projected request selects only those columns, so hidden columns cost
+nothing in the database or on the wire.
+"""
+
+from .edits import EDITABLE_FIELDS
+from .filters import FILTERABLE_FIELDS, INTEGER_FIELDS
+from .models import Person
+from .pagination import SORTABLE_FIELDS
+from .streaming import PERSON_FIELDS
+
+
+def _title(field):
+    name = str(field.verbose_name)
+    # Leave acronyms like "ID" alone
+    return name if name.isupper() else name.title()
+
+
+def person_columns():
+    """One dict per column, in PERSON_FIELDS order"""
+    columns = []
+    for name in PERSON_FIELDS:
+        integer = name in INTEGER_FIELDS
+        columns.append(
+            {
+                "field": name,
+                "title": _title(Person._meta.get_field(name)),
+                "type": "integer" if integer else "string",
+                "editable": name in EDITABLE_FIELDS,
+                "sortable": name in SORTABLE_FIELDS,
+                # The header filter each column gets in the sheet
+                "filter": ("=" if integer else "starts") if name in FILTERABLE_FIELDS else None,
+            }
+        )
+    return columns
+
+
+def parse_fields(fields):
+    """
+    The columns named by a comma-separated fields= parameter, in PERSON_FIELDS
+    order, or all of them if fields is empty.  id is always included, because
+    rows are identified by it.  Raises ValueError for unknown names.
+    """
+    if not fields:
+        return PERSON_FIELDS
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(PERSON_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(name for name in PERSON_FIELDS if name == "id" or name in requested)
@@ -0,0 +1,97 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_people_version
+from .importer import clean_field
+from .models import Person
+
+# Columns the sheet lets people edit
+EDITABLE_FIELDS = ("first_name", "last_name", "email", "age")
+
+BULK_UPDATE_BATCH_SIZE = 500
+
+
+def clean_patch(patch):
+    """
+    The patch's values as model field values, validated as an import would
+    validate them.  Raises ValueError for a value the database would reject,
+    including None: columns can't be cleared.
+    """
+    return {field: clean_field(field, value) for field, value in patch.items()}
+
+
+def apply_patch(person, patch):
+    """Set the fields of patch that differ on person, returning the names of those fields"""
+    changed = [field for field, value in patch.items() if getattr(person, field) != value]
+    for field in changed:
+        setattr(person, field, patch[field])
+    return changed
+
+
+def update_person_fields(person_id, patch):
+    """
+    Apply one row patch, writing only the columns whose values changed.
+
+    Returns (person, changed_fields); nothing is written when no values
+    changed.  Because other columns are left out of the UPDATE, concurrent
+    edits to different cells of the same row don't overwrite each other.
+    Raises Person.DoesNotExist for an unknown id.
+    """
+    person = Person.objects.only("id", *EDITABLE_FIELDS).get(id=person_id)
+    changed = apply_patch(person, patch)
+    if changed:
+        person.save(update_fields=[*changed, "updated_at"])
+    return person, changed
+
+
+def bulk_update_people(patches):
+    """
+    Apply many row patches in one transaction.
+
+    patches maps person id to a dict of the editable fields to change.  The
+    people are fetched in one query and written back with bulk_update(), so
+    a large paste costs a handful of queries rather than several per row.
+    Only rows and columns whose values actually changed are written: rows
+    are grouped by the columns they changed, with one bulk_update() per
+    group, so a row's other columns aren't overwritten from the copy read
+    here.
+    Returns (results, changed_rows): a per-row {"id", "success", "message"}
+    list in the order given, and the new values of every row written.
+    """
+    people = Person.objects.only("id", *EDITABLE_FIELDS).in_bulk(list(patches))
+    now = timezone.now()
+
+    results = []
+    updated = []
+    # Changed columns -> the rows that changed exactly those
+    groups = {}
+    for person_id, patch in patches.items():
+        person = people.get(person_id)
+        if person is None:
+            results.append({"id": person_id, "success": False, "message": "Person not found"})
+            continue
+        try:
+            patch = clean_patch(patch)
+        except ValueError as e:
+            results.append({"id": person_id, "success": False, "message": str(e)})
+            continue
+        results.append({"id": person_id, "success": True})
+        changed = apply_patch(person, patch)
+        if not changed:
+            continue
+        # bulk_update() bypasses auto_now, but delta sync depends on updated_at
+        person.updated_at = now
+        groups.setdefault(tuple(sorted(changed)), []).append(person)
+        updated.append(person)
+
+    if updated:
+        with transaction.atomic():
+            for fields, group in groups.items():
+                Person.objects.bulk_update(group, [*fields, "updated_at"], batch_size=BULK_UPDATE_BATCH_SIZE)
+            # bulk_update() sends no signals
+            bump_people_version()
+
+    changed_rows = [
+        {"id": person.id, **{field: getattr(person, field) for field in EDITABLE_FIELDS}} for person in updated
+    ]
+    return results, changed_rows
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import threading
+
+# How often an idle stream sends a comment line, so that proxies and load
+# balancers don't time out the connection.
+HEARTBEAT_SECONDS = 15
+
+# Messages queued for a client that isn't reading are dropped past this point.
+# The client falls back to delta sync, so a slow reader can't exhaust memory.
+MAX_QUEUED_MESSAGES = 100
+
+
+def format_event(event, data):
+    """Encode one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Broadcaster:
+    """
+    Fans events out to every Server-Sent Events stream open in this process.
+
+    Handlers publish from whichever thread they run on; each subscriber is an
+    asyncio queue that is fed on its own event loop.  Idle subscribers cost
+    nothing but a parked coroutine.  Subscribers only see events published
+    by the same process, so deployments with several workers should keep a
+    slow delta-sync poll as a backstop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def publish(self, event, data):
+        message = format_event(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, message)
+            except RuntimeError:
+                # The subscriber's loop has closed; it will unsubscribe itself
+                pass
+
+    @staticmethod
+    def _offer(queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+    async def subscribe(self, initial=()):
+        """Yield SSE messages (and heartbeat comments) until the client disconnects"""
+        entry = (asyncio.get_running_loop(), asyncio.Queue(maxsize=MAX_QUEUED_MESSAGES))
+        with self._lock:
+            self._subscribers.add(entry)
+        try:
+            for message in initial:
+                yield message
+            while True:
+                try:
+                    yield await asyncio.wait_for(entry[1].get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.discard(entry)
+
+
+broadcaster = Broadcaster()
+
+
+def publish_session(current_editor, time_remaining=None):
+    """Tell every viewer who holds the editing lock (by truncated UUID) and for how long"""
+    broadcaster.publish(
+        "session",
+        {
+            "current_editor": current_editor[:8] + "..." if current_editor else None,
+            "time_remaining": time_remaining,
+        },
+    )
+
+
+def publish_rows(rows):
+    """Tell every viewer that these rows have new values"""
+    broadcaster.publish("rows", {"changed": rows})
+
+
+def publish_leases(leases):
+    """Tell every viewer which row ranges are leased, as returned by leases.lease_holders()"""
+    broadcaster.publish("leases", {"leases": leases})
@@ -0,0 +1,214 @@
+"""
+Streaming import of people from CSV or XLSX.
+
+The file is read a row at a time, so memory use depends on the batch size
+rather than the file size.  Rows are validated a batch at a time and written
+with bulk_create(), one transaction per batch, so a failure part-way
+through keeps every batch before it.  Rows with an id update
+that person, in the same upsert statement; rows without one are inserted.
+Rows that fail validation are passed to a reject callback along with the
+reason, rather than stopping the import.
+"""
+
+import codecs
+import csv
+import zipfile
+import zlib
+from dataclasses import dataclass
+from xml.etree.ElementTree import ParseError
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connections, router, transaction
+
+from .cache import bump_people_version
+from .models import Person
+
+IMPORT_FIELDS = ("first_name", "last_name", "email", "age")
+IMPORT_BATCH_SIZE = 2000
+
+
+@dataclass
+class ImportResult:
+    processed: int = 0
+    created: int = 0
+    updated: int = 0
+    rejected: int = 0
+
+
+def read_csv(file):
+    """Yield the rows of a CSV file opened in binary mode, as lists of strings"""
+    text = codecs.getreader("utf-8-sig")(file)
+    try:
+        yield from csv.reader(text)
+    except UnicodeDecodeError:
+        raise ValueError("CSV files must be UTF-8")
+    except csv.Error as e:
+        raise ValueError(f"Not a readable CSV file: {e}")
+
+
+def read_xlsx(file):
+    """Yield the rows of the first sheet of an XLSX file, as lists of strings"""
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise ValueError("XLSX import needs openpyxl to be installed")
+
+    # A truncated or corrupt file fails in zipfile, zlib or the XML parser,
+    # either on opening or only once the sheet is read that far
+    errors = (zipfile.BadZipFile, zlib.error, KeyError, ParseError, InvalidFileException)
+    try:
+        # read_only mode parses the sheet as it is iterated instead of loading it
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except errors:
+        raise ValueError("Not a readable XLSX file")
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield ["" if value is None else str(value) for value in row]
+    except errors:
+        raise ValueError("Not a readable XLSX file")
+    finally:
+        workbook.close()
+
+
+def read_rows(file, name=""):
+    """Pick a reader for file by its name, defaulting to CSV"""
+    if name.lower().endswith(".xlsx"):
+        return read_xlsx(file)
+    return read_csv(file)
+
+
+def _columns(header):
+    """Map field names to their positions in the header row, raising ValueError if any are missing"""
+    positions = {name.strip().lower(): i for i, name in enumerate(header)}
+    missing = [field for field in IMPORT_FIELDS if field not in positions]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    return {field: positions[field] for field in ("id", *IMPORT_FIELDS) if field in positions}
+
+
+def clean_field(field, value):
+    """Turn one raw value into a model field value, raising ValueError for a bad one"""
+    if value is None:
+        raise ValueError(f"{field} is required")
+    if field == "age":
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValueError(f"age {value!r} is not a whole number")
+        if value < 0:
+            raise ValueError("Age cannot be negative")
+        return value
+
+    value = str(value).strip()
+    if field == "email":
+        try:
+            validate_email(value)
+        except ValidationError:
+            raise ValueError(f"{value!r} is not a valid email address")
+    elif not value:
+        raise ValueError(f"{field} is required")
+    # Longer values are a DataError on databases that enforce the length
+    max_length = Person._meta.get_field(field).max_length
+    if len(value) > max_length:
+        raise ValueError(f"{field} is longer than {max_length} characters")
+    return value
+
+
+def clean_row(values):
+    """Turn a row's raw values into model field values, raising ValueError for bad ones"""
+    row = {field: clean_field(field, values.get(field, "")) for field in IMPORT_FIELDS}
+    if values.get("id", "").strip():
+        try:
+            row["id"] = int(values["id"])
+        except ValueError:
+            raise ValueError(f"id {values['id']!r} is not a whole number")
+    return row
+
+
+def _write_batch(batch, result, reject):
+    """Validate and save one batch of (line, values) pairs"""
+    new = []
+    existing = []
+    ids = set()
+    for line, values in batch:
+        try:
+            row = clean_row(values)
+        except ValueError as e:
+            result.rejected += 1
+            reject(line, values, str(e))
+            continue
+        if "id" in row:
+            existing.append((line, values, row))
+            ids.add(row["id"])
+        else:
+            new.append(Person(**row))
+
+    # Rows naming an id may only update that person, never create one with
+    # a chosen id, which would leave the database's id sequence behind.
+    known = set(Person.objects.filter(id__in=ids).values_list("id", flat=True))
+    updates = {}
+    for line, values, row in existing:
+        if row["id"] in known:
+            updates[row["id"]] = Person(**row)
+        else:
+            result.rejected += 1
+            reject(line, values, f"No person with id {row['id']}")
+
+    with transaction.atomic():
+        if new:
+            Person.objects.bulk_create(new)
+        if updates:
+            # MySQL can't name the conflicting columns, and needn't: id is the
+            # only unique key these rows can collide on
+            features = connections[router.db_for_write(Person)].features
+            target = {"unique_fields": ["id"]} if features.supports_update_conflicts_with_target else {}
+            # Every row conflicts, so this only ever updates; created_at is left alone
+            Person.objects.bulk_create(
+                updates.values(),
+                update_conflicts=True,
+                update_fields=[*IMPORT_FIELDS, "updated_at"],
+                **target,
+            )
+        if new or updates:
+            # bulk_create() sends no signals
+            bump_people_version()
+    result.created += len(new)
+    result.updated += len(updates)
+
+
+def import_people(rows, batch_size=IMPORT_BATCH_SIZE, reject=None, progress=None):
+    """
+    Import people from an iterable of rows, the first of which names the columns.
+
+    The columns first_name, last_name, email and age are required, and id is
+    optional.  reject(line, values, error) is called for each row that can't
+    be imported, and progress(result) after each batch.  Returns an
+    ImportResult.  Raises ValueError if the header is missing or incomplete.
+    """
+    rows = iter(rows)
+    try:
+        columns = _columns(next(rows))
+    except StopIteration:
+        raise ValueError("The file is empty")
+    reject = reject or (lambda line, values, error: None)
+
+    result = ImportResult()
+    batch = []
+    for line, raw in enumerate(rows, start=2):
+        if not any(cell.strip() for cell in raw):
+            continue
+        batch.append((line, {field: raw[i] if i < len(raw) else "" for field, i in columns.items()}))
+        if len(batch) >= batch_size:
+            result.processed += len(batch)
+            _write_batch(batch, result, reject)
+            batch = []
+            if progress:
+                progress(result)
+    if batch:
+        result.processed += len(batch)
+        _write_batch(batch, result, reject)
+        if progress:
+            progress(result)
+    return result
@@ -0,0 +1,182 @@
+"""
+Row-range leases.
+
+Besides the whole-sheet editing lock, a tab may lease a range of Person ids
+so that several people can edit different parts of the sheet at once.  A
+lease is extended by the same keepalives as the editing lock and lapses
+after SESSION_TIMEOUT seconds without one.  Leases conflict with each other
+when their ranges overlap, and with the editing lock when someone else
+holds it.
+
+The lock and the leases may live in different stores, so no one transaction
+covers both.  Instead each side claims first and checks the other side
+afterwards, backing out on a conflict: a lease claim looks for the lock
+once its lease is committed, and a lock claim looks for leases once it
+holds the lock.  Of two racing claims at least one sees the other.
+"""
+
+from contextlib import contextmanager
+
+from django.db import NotSupportedError, connection, transaction
+from django.utils import timezone
+
+from .locks import SESSION_TIMEOUT, get_lock_backend
+from .models import RowLease
+
+# Key for the PostgreSQL advisory lock, and name of the MySQL named lock,
+# that serialise lease claims
+ADVISORY_LOCK_KEY = 0x5EA5E
+NAMED_LOCK = "spreadui:lease-claims"
+
+# Seconds to wait for the MySQL named lock before refusing the claim
+NAMED_LOCK_TIMEOUT = 10
+
+
+def _cutoff():
+    return timezone.now() - timezone.timedelta(seconds=SESSION_TIMEOUT)
+
+
+def live_leases():
+    return RowLease.objects.filter(last_keepalive__gte=_cutoff())
+
+
+@contextmanager
+def _serialised_claims():
+    """
+    A transaction in which no other claim checks for conflicts at the same time.
+
+    PostgreSQL takes a transaction-level advisory lock.  MySQL takes a named
+    lock, which belongs to the connection rather than the transaction, so it
+    is held around the transaction and released afterwards.  On SQLite the
+    first write of the transaction takes the database write lock, so the
+    caller's opening DELETE is enough.  Any other database raises
+    NotSupportedError rather than letting overlapping claims through.
+    Raises TimeoutError if the MySQL lock can't be had in NAMED_LOCK_TIMEOUT.
+    """
+    if connection.vendor == "mysql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT GET_LOCK(%s, %s)", [NAMED_LOCK, NAMED_LOCK_TIMEOUT])
+            if cursor.fetchone()[0] != 1:
+                raise TimeoutError("Timed out waiting for other lease claims")
+        try:
+            with transaction.atomic():
+                yield
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", [NAMED_LOCK])
+        return
+
+    if connection.vendor not in ("postgresql", "sqlite"):
+        raise NotSupportedError(f"Row leases can't serialise claims on {connection.vendor}")
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [ADVISORY_LOCK_KEY])
+        yield
+
+
+def conflicting_lease(uuid, first_id, last_id):
+    """
+    Return another tab's live lease overlapping first_id..last_id, or None.
+
+    Live leases don't overlap each other, so the only ones that can reach
+    into the range are those starting inside it, and the single lease with
+    the greatest first_id before it.  Each is found with an index seek.
+    """
+    inside = (
+        live_leases()
+        .filter(first_id__gte=first_id, first_id__lte=last_id)
+        .exclude(uuid=uuid)
+        .order_by("first_id")
+        .first()
+    )
+    if inside:
+        return inside
+    before = live_leases().filter(first_id__lt=first_id).order_by("-first_id").first()
+    if before and before.last_id >= first_id and before.uuid != uuid:
+        return before
+    return None
+
+
+def _locked_by_other(backend, uuid):
+    holder, _ = backend.status()
+    return bool(holder and holder != uuid)
+
+
+def acquire_lease(uuid, first_id, last_id):
+    """Lease rows first_id..last_id to uuid, replacing any of its own leases they overlap.  Return True on success."""
+    backend = get_lock_backend()
+    if _locked_by_other(backend, uuid):
+        return False
+
+    try:
+        with _serialised_claims():
+            RowLease.objects.filter(uuid=uuid, last_keepalive__lt=_cutoff()).delete()
+            if conflicting_lease(uuid, first_id, last_id):
+                return False
+            RowLease.objects.filter(uuid=uuid, first_id__lte=last_id, last_id__gte=first_id).delete()
+            lease = RowLease.objects.create(uuid=uuid, first_id=first_id, last_id=last_id)
+    except TimeoutError:
+        return False
+
+    # The sheet lock may have been claimed while the lease was
+    if _locked_by_other(backend, uuid):
+        lease.delete()
+        return False
+    return True
+
+
+def extend_leases(uuid):
+    """Extend all of uuid's live leases, returning how many there were"""
+    return live_leases().filter(uuid=uuid).update(last_keepalive=timezone.now())
+
+
+async def aextend_leases(uuid):
+    return await live_leases().filter(uuid=uuid).aupdate(last_keepalive=timezone.now())
+
+
+def release_leases(uuid):
+    """Give up all of uuid's leases, returning how many there were"""
+    deleted, _ = RowLease.objects.filter(uuid=uuid).delete()
+    return deleted
+
+
+async def arelease_leases(uuid):
+    deleted, _ = await RowLease.objects.filter(uuid=uuid).adelete()
+    return deleted
+
+
+def leased_ranges(uuid):
+    """The (first_id, last_id) ranges uuid holds live leases on"""
+    return list(live_leases().filter(uuid=uuid).values_list("first_id", "last_id"))
+
+
+def others_hold_leases(uuid):
+    return live_leases().exclude(uuid=uuid).exists()
+
+
+async def aothers_hold_leases(uuid):
+    return await live_leases().exclude(uuid=uuid).aexists()
+
+
+def _holder(uuid, first_id, last_id):
+    return {"first_id": first_id, "last_id": last_id, "holder": uuid[:8] + "..."}
+
+
+def _holders_query():
+    return live_leases().order_by("first_id").values_list("uuid", "first_id", "last_id")
+
+
+def lease_holders():
+    """Every live lease as {"first_id", "last_id", "holder"}, holder being a truncated UUID"""
+    return [_holder(*lease) for lease in _holders_query()]
+
+
+async def alease_holders():
+    return [_holder(*lease) async for lease in _holders_query()]
+
+
+def sweep_leases():
+    """Delete lapsed leases, returning how many there were"""
+    deleted, _ = RowLease.objects.filter(last_keepalive__lt=_cutoff()).delete()
+    return deleted
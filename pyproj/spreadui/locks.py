@@ -0,0 +1,314 @@
+"""
+The single-editor lock.
+
+Only one browser tab may edit the sheet at a time.  The tab claims the lock
+with its UUID and must keep extending it; a lock that hasn't been extended
+for SESSION_TIMEOUT seconds lapses and anyone may claim it.
+
+Where the lock lives is pluggable, chosen by the SPREADUI_LOCK_BACKEND
+setting:
+
+    spreadui.locks.DatabaseLockBackend (default)
+        EditingSession rows in the default database.
+
+    spreadui.locks.CacheLockBackend
+        A single key in Django's cache (SPREADUI_LOCK_CACHE, default "default"),
+        claimed with an atomic add() and expired by the key's TTL.  Only for a
+        cache local to one process, such as locmem.
+
+    spreadui.locks.RedisLockBackend
+        A single key in Redis at SPREADUI_LOCK_REDIS_URL (default: the
+        LOCATION of the SPREADUI_LOCK_CACHE cache).  Use this one with more
+        than one worker process.
+"""
+
+import functools
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import EditingSession
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+SESSION_TIMEOUT = 30  # seconds
+LOCK_SLOT = 1
+
+
+class BaseLockBackend:
+    def status(self):
+        """Return (holder_uuid, time_remaining) for the live lock, or (None, None) if it is free"""
+        raise NotImplementedError
+
+    def acquire(self, uuid):
+        """Claim the lock for uuid, or extend it if uuid already holds it.  Return True on success."""
+        raise NotImplementedError
+
+    def keepalive(self, uuid):
+        """Extend the lock if uuid holds it, without claiming a free one.  Return True on success."""
+        raise NotImplementedError
+
+    def release(self, uuid):
+        """Give up the lock if uuid holds it.  Return True on success."""
+        raise NotImplementedError
+
+    def sweep(self):
+        """
+        Remove lapsed locks and return how many were removed.  Lapsed locks are
+        already ignored by every operation, so this only reclaims space and is
+        run periodically rather than on each request.
+        """
+        return 0
+
+    # Async versions for async views.  By default they run the sync method in
+    # a worker thread; backends override them where they have a native
+    # async path.
+
+    async def astatus(self):
+        return await sync_to_async(self.status)()
+
+    async def aacquire(self, uuid):
+        return await sync_to_async(self.acquire)(uuid)
+
+    async def akeepalive(self, uuid):
+        return await sync_to_async(self.keepalive)(uuid)
+
+    async def arelease(self, uuid):
+        return await sync_to_async(self.release)(uuid)
+
+
+class DatabaseLockBackend(BaseLockBackend):
+    """
+    The lock is the EditingSession row in slot 1.
+
+    Each operation is a single statement whose WHERE clause decides the
+    outcome, so there is no read-then-write window for two tabs to race
+    through.  A lapsed session is treated as absent by every predicate and
+    simply overwritten by the next claimer, and releasing the lock just
+    back-dates the row so that it has lapsed.  The one exception is claiming
+    the lock when no row exists at all, which falls back to an INSERT that
+    the unique slot lets only one claimer win.
+    """
+
+    released = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+    def _cutoff(self):
+        return timezone.now() - timezone.timedelta(seconds=SESSION_TIMEOUT)
+
+    def _live(self):
+        return EditingSession.objects.filter(last_keepalive__gte=self._cutoff()).values_list("uuid", "last_keepalive")
+
+    def _status(self, session):
+        if session is None:
+            return None, None
+        uuid, last_keepalive = session
+        time_remaining = SESSION_TIMEOUT - (timezone.now() - last_keepalive).seconds
+        return uuid, max(0, time_remaining)
+
+    def _claimable(self, uuid):
+        # Our own lock, to extend, or one that has lapsed, to take over
+        return EditingSession.objects.filter(slot=LOCK_SLOT).filter(Q(uuid=uuid) | Q(last_keepalive__lt=self._cutoff()))
+
+    def _claim_free_slot(self, uuid):
+        # Either someone else holds the lock or nobody has a row yet
+        try:
+            with transaction.atomic():
+                EditingSession.objects.create(slot=LOCK_SLOT, uuid=uuid)
+        except IntegrityError:
+            return False
+        return True
+
+    def _held_by(self, uuid):
+        return EditingSession.objects.filter(uuid=uuid, last_keepalive__gte=self._cutoff())
+
+    def status(self):
+        return self._status(self._live().first())
+
+    def acquire(self, uuid):
+        if self._claimable(uuid).update(uuid=uuid, last_keepalive=timezone.now()):
+            return True
+        return self._claim_free_slot(uuid)
+
+    def keepalive(self, uuid):
+        return bool(self._held_by(uuid).update(last_keepalive=timezone.now()))
+
+    def release(self, uuid):
+        return bool(self._held_by(uuid).update(last_keepalive=self.released))
+
+    async def astatus(self):
+        return self._status(await self._live().afirst())
+
+    async def aacquire(self, uuid):
+        if await self._claimable(uuid).aupdate(uuid=uuid, last_keepalive=timezone.now()):
+            return True
+        # Rare, and the async ORM has no transactions, so the INSERT runs in a thread
+        return await sync_to_async(self._claim_free_slot)(uuid)
+
+    async def akeepalive(self, uuid):
+        return bool(await self._held_by(uuid).aupdate(last_keepalive=timezone.now()))
+
+    async def arelease(self, uuid):
+        return bool(await self._held_by(uuid).aupdate(last_keepalive=self.released))
+
+    def sweep(self):
+        deleted, _ = EditingSession.objects.filter(last_keepalive__lt=self._cutoff()).delete()
+        return deleted
+
+
+class CacheLockBackend(BaseLockBackend):
+    """
+    The lock is one cache key holding the editor's UUID and expiry time.
+
+    Claiming uses cache.add(), which only one client can win, and the key's
+    TTL expires an abandoned lock without any sweeping.  No database queries
+    are made.
+
+    Extending and releasing read the key and then write it, and Django's
+    cache API has no way to make that one atomic step.  If the key lapsed
+    in between, the write would land on the next holder's lock, so each
+    operation holds a process-wide mutex.  That only works when every
+    client of the cache is in this process; otherwise use RedisLockBackend.
+    """
+
+    key = "spreadui:editing-lock"
+
+    # Shared by every instance, since get_lock_backend() makes a new one each time
+    mutex = threading.Lock()
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, "SPREADUI_LOCK_CACHE", "default")]
+
+    def _value(self, uuid):
+        return {"uuid": uuid, "expires": time.time() + SESSION_TIMEOUT}
+
+    def _live(self, value):
+        if value is None or value["expires"] <= time.time():
+            return None
+        return value
+
+    def _status(self, value):
+        if value is None:
+            return None, None
+        return value["uuid"], max(0, int(value["expires"] - time.time()))
+
+    def _held_by(self, value, uuid):
+        return value is not None and value["uuid"] == uuid
+
+    def status(self):
+        return self._status(self._live(self.cache.get(self.key)))
+
+    def acquire(self, uuid):
+        with self.mutex:
+            if self.cache.add(self.key, self._value(uuid), SESSION_TIMEOUT):
+                return True
+            return self._keepalive(uuid)
+
+    def keepalive(self, uuid):
+        with self.mutex:
+            return self._keepalive(uuid)
+
+    def _keepalive(self, uuid):
+        if not self._held_by(self._live(self.cache.get(self.key)), uuid):
+            return False
+        self.cache.set(self.key, self._value(uuid), SESSION_TIMEOUT)
+        return True
+
+    def release(self, uuid):
+        with self.mutex:
+            if not self._held_by(self._live(self.cache.get(self.key)), uuid):
+                return False
+            self.cache.delete(self.key)
+            return True
+
+    async def astatus(self):
+        return self._status(self._live(await self.cache.aget(self.key)))
+
+
+# Each checks the holder and changes the key in one atomic step
+KEEPALIVE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class RedisLockBackend(BaseLockBackend):
+    """
+    The lock is one Redis key holding the editor's UUID, expiring when the lock does.
+
+    Claiming is SET NX, and extending and releasing are Lua scripts that
+    only touch the key if it still names the caller, so a lock that lapses
+    part way through can't be extended or deleted from under its next
+    holder.  Every operation is a single round trip.
+
+    The key is kept as a plain string, which the cache API would pickle, so
+    this talks to Redis with its own client rather than through the cache.
+    """
+
+    key = "spreadui:editing-lock"
+
+    def __init__(self):
+        if redis is None:
+            raise ImproperlyConfigured("RedisLockBackend needs the redis package")
+        self.client = redis_client(lock_redis_url())
+
+    def status(self):
+        uuid, ttl = self.client.pipeline().get(self.key).pttl(self.key).execute()
+        if uuid is None:
+            return None, None
+        return uuid.decode(), max(0, ttl // 1000)
+
+    def acquire(self, uuid):
+        if self.client.set(self.key, uuid, nx=True, px=SESSION_TIMEOUT * 1000):
+            return True
+        return self.keepalive(uuid)
+
+    def keepalive(self, uuid):
+        return bool(self.client.eval(KEEPALIVE_SCRIPT, 1, self.key, uuid, SESSION_TIMEOUT * 1000))
+
+    def release(self, uuid):
+        return bool(self.client.eval(RELEASE_SCRIPT, 1, self.key, uuid))
+
+
+def lock_redis_url():
+    url = getattr(settings, "SPREADUI_LOCK_REDIS_URL", None)
+    if url:
+        return url
+    location = settings.CACHES[getattr(settings, "SPREADUI_LOCK_CACHE", "default")].get("LOCATION", "")
+    if isinstance(location, str):
+        location = location.split(",")
+    # RedisCache writes to the first server
+    if not location or not location[0].startswith(("redis://", "rediss://", "unix://")):
+        raise ImproperlyConfigured("Set SPREADUI_LOCK_REDIS_URL, or point SPREADUI_LOCK_CACHE at a Redis cache")
+    return location[0]
+
+
+@functools.lru_cache
+def redis_client(url):
+    """A client for url, shared so that its connection pool is"""
+    return redis.Redis.from_url(url)
+
+
+def get_lock_backend():
+    backend = getattr(settings, "SPREADUI_LOCK_BACKEND", "spreadui.locks.DatabaseLockBackend")
+    return import_string(backend)()
@@ -0,0 +1,97 @@
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.module_loading import import_string
+
+from spreadui.bench import TRANSACTION_CONTROL
+from spreadui.locks import get_lock_backend
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the editing lock: queries per call for each operation, and how many '
+        'of N concurrent claimers win a free lock.  Takes over the lock, so only run it '
+        'against a development database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', help='Lock backend to test (default: SPREADUI_LOCK_BACKEND)')
+        parser.add_argument('--claimers', type=int, default=20, help='Concurrent claimers per round')
+        parser.add_argument('--rounds', type=int, default=10, help='Number of concurrent rounds')
+
+    def handle(self, *args, **options):
+        backend = import_string(options['backend'])() if options['backend'] else get_lock_backend()
+        self.stdout.write(f'Backend: {type(backend).__module__}.{type(backend).__name__}')
+
+        self.report_queries(backend)
+        failures = self.race(backend, options['claimers'], options['rounds'])
+        if failures:
+            raise CommandError(f'{failures} round(s) did not have exactly one winner')
+
+    def report_queries(self, backend):
+        self.free_lock(backend)
+
+        steps = [
+            ('status (free)', lambda: backend.status()),
+            ('acquire (free)', lambda: backend.acquire('bench-a')),
+            ('release', lambda: backend.release('bench-a')),
+            ('acquire (free)', lambda: backend.acquire('bench-a')),
+            ('acquire (extend)', lambda: backend.acquire('bench-a')),
+            ('acquire (denied)', lambda: backend.acquire('bench-b')),
+            ('status (held)', lambda: backend.status()),
+            ('keepalive', lambda: backend.keepalive('bench-a')),
+            ('release', lambda: backend.release('bench-a')),
+        ]
+
+        self.stdout.write('\nStatements per call')
+        for name, step in steps:
+            with CaptureQueriesContext(connection) as ctx:
+                result = step()
+            # Don't count transaction bookkeeping (BEGIN, COMMIT, savepoints)
+            statements = [q['sql'] for q in ctx.captured_queries if not TRANSACTION_CONTROL.match(q['sql'])]
+            self.stdout.write(f'  {name:<18} {len(statements)} statement(s)  -> {result}')
+
+    def race(self, backend, claimers, rounds):
+        self.stdout.write(f'\n{claimers} concurrent claimers x {rounds} rounds')
+        failures = 0
+        for round_number in range(rounds):
+            self.free_lock(backend)
+            barrier = threading.Barrier(claimers)
+            results = [None] * claimers
+
+            def claim(i):
+                try:
+                    barrier.wait()
+                    results[i] = backend.acquire(f'bench-{round_number}-{i}')
+                except Exception as e:
+                    results[i] = e
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=claim, args=(i,)) for i in range(claimers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            winners = results.count(True)
+            errors = [r for r in results if isinstance(r, Exception)]
+            if winners != 1:
+                failures += 1
+            self.stdout.write(f'  round {round_number + 1}: {winners} winner(s), {len(errors)} error(s)')
+            for error in errors[:3]:
+                self.stdout.write(f'    {type(error).__name__}: {error}')
+
+        self.free_lock(backend)
+        if failures:
+            self.stdout.write(self.style.ERROR(f'{failures} round(s) failed'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Every round had exactly one winner'))
+        return failures
+
+    def free_lock(self, backend):
+        holder, _ = backend.status()
+        if holder:
+            backend.release(holder)
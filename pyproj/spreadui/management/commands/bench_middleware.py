@@ -0,0 +1,78 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from spreadui.bench import Timings, format_summary, local_client
+from spreadui.middleware import fast_paths
+from spreadui.sync import issue_watermark
+
+
+def stacks():
+    """(name, settings overrides) for each middleware stack to time"""
+    # The debug toolbar's own overhead would swamp everything else
+    middleware = [path for path in settings.MIDDLEWARE if not path.startswith('debug_toolbar.')]
+    return (
+        ('no middleware', {'MIDDLEWARE': []}),
+        (
+            'full stack',
+            {
+                'MIDDLEWARE': middleware,
+                'SPREADUI_FAST_PATHS': (),
+                'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+            },
+        ),
+        ('fast path', {'MIDDLEWARE': middleware}),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the per-request cost of the middleware stack on the polling routes in SPREADUI_FAST_PATHS: '
+        'with no middleware at all, with every middleware and database sessions (as before the fast path), '
+        'and with the fast path and the configured SESSION_ENGINE.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per route and stack')
+
+    def handle(self, *args, **options):
+        paths = list(fast_paths())
+        if not paths:
+            raise CommandError('SPREADUI_FAST_PATHS is empty')
+        params = {
+            '/api/session/status': {'uuid': 'bench-middleware'},
+            '/api/people/changes': {'since': issue_watermark()},
+        }
+        user, _ = get_user_model().objects.get_or_create(email='bench-middleware@example.com')
+
+        rows = []
+        for stack, overrides in stacks():
+            with override_settings(**overrides):
+                client = local_client(user)
+                for path in paths:
+                    rows.extend(self.time(client, f'{path} [{stack}]', path, params.get(path), options['requests']))
+        self.stdout.write(format_summary(rows))
+
+        p50 = {row['label']: row['p50'] for row in rows}
+        self.stdout.write('\nMiddleware overhead per request (p50, over no middleware)')
+        for path in paths:
+            bare = p50[f'{path} [no middleware]']
+            full = p50[f'{path} [full stack]'] - bare
+            fast = p50[f'{path} [fast path]'] - bare
+            self.stdout.write(f'  {path}: full stack {full * 1000:.0f} us, fast path {fast * 1000:.0f} us')
+
+    def time(self, client, label, path, params, count):
+        for _ in range(min(count, 50)):
+            # Warm up, so the first request's setup isn't counted
+            client.get(path, params)
+        timings = Timings()
+        started = time.perf_counter()
+        for _ in range(count):
+            with timings.measure(label):
+                response = client.get(path, params)
+            if response.status_code != 200:
+                raise CommandError(f'GET {path} returned {response.status_code}')
+        return timings.summary(time.perf_counter() - started)
@@ -0,0 +1,81 @@
+import time
+from typing import List
+
+from django.core.management.base import BaseCommand
+from ninja.renderers import JSONRenderer
+from pydantic import TypeAdapter
+
+from spreadui.api import PersonSchema
+from spreadui.renderers import ORJSONRenderer, orjson
+from spreadui.seeding import chunk_sizes, generate_chunk
+from spreadui.streaming import PERSON_FIELDS
+
+SEED = 1
+
+
+def schema_json(rows):
+    # What Ninja does for a response=List[PersonSchema] endpoint
+    adapter = TypeAdapter(List[PersonSchema])
+    return JSONRenderer().render(None, adapter.dump_python(adapter.validate_python(rows)), response_status=200)
+
+
+def values_json(rows):
+    return JSONRenderer().render(None, rows, response_status=200)
+
+
+def values_orjson(rows):
+    return ORJSONRenderer().render(None, rows, response_status=200)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark rendering the people list as JSON: the schema-validated path Ninja takes by default, '
+        'values() rows through the default renderer, and values() rows through orjson.  Rows are generated '
+        'in memory, so this measures serialisation alone and needs no database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[10_000, 100_000, 1_000_000],
+            help='Row counts to render (default: 10000 100000 1000000)',
+        )
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per path, of which the fastest is reported')
+
+    def handle(self, *args, **options):
+        paths = [('schema + json', schema_json), ('values + json', values_json)]
+        if orjson is not None:
+            paths.append(('values + orjson', values_orjson))
+        else:
+            self.stdout.write('orjson is not installed, so its path is skipped')
+
+        self.stdout.write(f'{"rows":>9}  {"path":<15}  {"seconds":>8}  {"MB":>7}  {"MB/s":>7}  {"speedup":>7}')
+        for size in options['sizes']:
+            rows = self.make_rows(size)
+            baseline = None
+            for label, render in paths:
+                seconds, length = self.time(render, rows, options['repeat'])
+                baseline = baseline or seconds
+                self.stdout.write(
+                    f'{size:>9}  {label:<15}  {seconds:>8.3f}  {length / 1e6:>7.1f}  '
+                    f'{length / 1e6 / seconds:>7.1f}  {baseline / seconds:>6.1f}x'
+                )
+
+    def make_rows(self, count):
+        """count dicts shaped like Person.objects.values(*PERSON_FIELDS) rows"""
+        rows = []
+        for index, size in chunk_sizes(count, 10_000):
+            for person in generate_chunk(SEED, index, size):
+                rows.append(dict(zip(PERSON_FIELDS, (len(rows) + 1, *person))))
+        return rows
+
+    def time(self, render, rows, repeat):
+        best = None
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            content = render(rows)
+            seconds = time.perf_counter() - started
+            best = seconds if best is None else min(best, seconds)
+        return best, len(content if isinstance(content, bytes) else content.encode())
@@ -0,0 +1,71 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from spreadui.importer import IMPORT_BATCH_SIZE, IMPORT_FIELDS, import_people, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Import people from a CSV or XLSX file with first_name, last_name, email and age columns, '
+        'and optionally id to update existing people.  Rows that cannot be imported are written '
+        'to a reject file.  Does not check the editing lock.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file to import')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Rows per transaction')
+        parser.add_argument('--rejects', help='Where to write rejected rows (default: PATH.rejects.csv)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        rejects_path = options['rejects'] or f'{path}.rejects.csv'
+        started = time.monotonic()
+
+        with open(path, 'rb') as file, RejectFile(rejects_path) as rejects:
+            try:
+                result = import_people(
+                    read_rows(file, path),
+                    batch_size=options['batch_size'],
+                    reject=rejects.write,
+                    progress=self.report,
+                )
+            except ValueError as e:
+                raise CommandError(e)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Created {result.created} and updated {result.updated} people in {elapsed:.1f}s '
+                f'({result.processed / max(elapsed, 0.001):,.0f} rows/s)'
+            )
+        )
+        if result.rejected:
+            self.stdout.write(self.style.WARNING(f'Rejected {result.rejected} row(s), written to {rejects_path}'))
+
+    def report(self, result):
+        self.stdout.write(f'{result.processed} rows processed, {result.rejected} rejected')
+
+
+class RejectFile:
+    """Writes rejected rows as CSV, creating the file only if there are any"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.writer = None
+
+    def write(self, line, values, error):
+        if self.writer is None:
+            self.file = open(self.path, 'w', newline='', encoding='utf-8')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(['line', 'id', *IMPORT_FIELDS, 'error'])
+        self.writer.writerow([line, values.get('id', ''), *(values.get(field, '') for field in IMPORT_FIELDS), error])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.file:
+            self.file.close()
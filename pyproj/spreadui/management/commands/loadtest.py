@@ -0,0 +1,174 @@
+import io
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from spreadui.bench import Timings, format_summary, local_client
+from spreadui.models import Person
+
+SEED = 1
+
+
+class LocalClient:
+    """Sends requests through Django's test Client in this process, so queries can be counted"""
+
+    counts_queries = True
+
+    def __init__(self, user):
+        self.client = local_client(user)
+
+    def request(self, method, path, params=None, body=None):
+        if method == 'GET':
+            response = self.client.get(path, params)
+        else:
+            response = self.client.generic(method, path, json.dumps(body), content_type='application/json')
+        return response.status_code, response.json() if response.status_code == 200 else None
+
+
+class RemoteClient:
+    """Sends requests to a running server, authenticated by a session cookie"""
+
+    counts_queries = False
+
+    def __init__(self, base_url, sessionid):
+        self.base_url = base_url.rstrip('/')
+        self.sessionid = sessionid
+
+    def request(self, method, path, params=None, body=None):
+        url = self.base_url + path
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(url, data=data, method=method)
+        request.add_header('Content-Type', 'application/json')
+        request.add_header('Cookie', f'sessionid={self.sessionid}')
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the sheet API with N viewers polling and M editors saving rows, and report p50/p99 latency, '
+        'throughput and queries per request for each endpoint.  By default requests run in this process '
+        'through the test client; with --url they go to a running server instead.  Reseeds the People table '
+        'for each --sizes entry, so only run it against a development database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--viewers', type=int, default=50, help='Tabs polling for status and changes')
+        parser.add_argument('--editors', type=int, default=2, help='Tabs competing for the lock and saving rows')
+        parser.add_argument('--iterations', type=int, default=20, help='Rounds of requests per tab')
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1000], help='Table sizes to seed and test (default: 1000)'
+        )
+        parser.add_argument('--no-seed', action='store_true', help='Test the table as it is instead of reseeding')
+        parser.add_argument('--url', help='Base URL of a running server, e.g. http://localhost:8000')
+        parser.add_argument('--sessionid', help='Session cookie of a logged-in user, for --url')
+
+    def handle(self, *args, **options):
+        if options['url'] and not options['sessionid']:
+            raise CommandError('--url needs --sessionid')
+
+        sizes = [None] if options['no_seed'] else options['sizes']
+        for size in sizes:
+            if size is not None:
+                call_command('populate_people', size, '--seed', SEED, stdout=io.StringIO())
+            ids = list(Person.objects.values_list('id', flat=True)[:1000])
+            if not ids:
+                raise CommandError('The People table is empty')
+
+            self.stdout.write(
+                f'\n{Person.objects.count()} people, {options["viewers"]} viewers, {options["editors"]} editors, '
+                f'{options["iterations"]} iterations'
+            )
+            timings, elapsed, errors = self.run(ids, options)
+            summary = timings.summary(elapsed)
+            self.stdout.write(format_summary(summary))
+            total = sum(row['requests'] for row in summary)
+            self.stdout.write(f'{total} requests in {elapsed:.2f}s ({total / elapsed:.1f} req/s)')
+            if errors:
+                self.stdout.write(self.style.ERROR(f'{len(errors)} error(s), first: {errors[0]}'))
+
+    def run(self, ids, options):
+        user, _ = get_user_model().objects.get_or_create(email='loadtest@example.com')
+        timings = Timings()
+        errors = []
+        tabs = [self.viewer] * options['viewers'] + [self.editor] * options['editors']
+        # Log the tabs in here rather than in their threads, so that logins
+        # don't compete with each other or with the timed requests
+        if options['url']:
+            clients = [RemoteClient(options['url'], options['sessionid']) for _ in tabs]
+        else:
+            clients = [LocalClient(user) for _ in tabs]
+        barrier = threading.Barrier(len(tabs) + 1)
+
+        def run_tab(tab, client):
+            try:
+                barrier.wait()
+                tab(client, timings, ids, options['iterations'])
+            except Exception as e:
+                errors.append(f'{type(e).__name__}: {e}')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run_tab, args=(tab, client)) for tab, client in zip(tabs, clients)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return timings, time.perf_counter() - started, errors
+
+    def call(self, client, timings, label, method, path, params=None, body=None):
+        with timings.measure(label, count=client.counts_queries):
+            status, data = client.request(method, path, params, body)
+        if status != 200:
+            raise CommandError(f'{method} {path} returned {status}')
+        return data
+
+    def viewer(self, client, timings, ids, iterations):
+        tab = str(uuid.uuid4())
+        watermark = self.call(client, timings, 'GET /people/changes', 'GET', '/api/people/changes')['watermark']
+        self.call(client, timings, 'GET /people/page', 'GET', '/api/people/page', {'size': 100})
+        for _ in range(iterations):
+            self.call(client, timings, 'GET /session/status', 'GET', '/api/session/status', {'uuid': tab})
+            changes = self.call(
+                client, timings, 'GET /people/changes', 'GET', '/api/people/changes', {'since': watermark}
+            )
+            watermark = changes['watermark']
+
+    def editor(self, client, timings, ids, iterations):
+        tab = str(uuid.uuid4())
+        for i in range(iterations):
+            self.call(client, timings, 'GET /session/status', 'GET', '/api/session/status', {'uuid': tab})
+            edit = self.call(client, timings, 'POST /session/edit', 'POST', '/api/session/edit', body={'uuid': tab})
+            if not edit['success']:
+                continue
+            person_id = random.choice(ids)
+            body = {
+                'uuid': tab,
+                'first_name': 'Load',
+                'last_name': 'Test',
+                'email': f'load.test{person_id}@example.com',
+                'age': random.randint(18, 80),
+            }
+            self.call(client, timings, 'PUT /people/{id}', 'PUT', f'/api/people/{person_id}', body=body)
+            self.call(client, timings, 'POST /session/keepalive', 'POST', '/api/session/keepalive', body={'uuid': tab})
+            if i % 5 == 4:
+                # Give the other editors a turn
+                self.call(client, timings, 'POST /session/end', 'POST', '/api/session/end', body={'uuid': tab})
+        self.call(client, timings, 'POST /session/end', 'POST', '/api/session/end', body={'uuid': tab})
@@ -1,19 +1,103 @@
+import csv
+import io
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 from django.core.management.base import BaseCommand
-from spreadui.factories import PersonFactory
-from spreadui.models import Person
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from spreadui.cache import bump_people_version
+from spreadui.models import Person, PersonTombstone
+from spreadui.seeding import chunk_sizes, generate_chunk
+
+COLUMNS = ('first_name', 'last_name', 'email', 'age')
 
 
 class Command(BaseCommand):
-    help = 'Populate People table with specified number of entries'
+    help = (
+        'Replace the People table with the specified number of generated entries.  '
+        'The table is truncated rather than deleted row by row, so open sheets should be reloaded afterwards.'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument('count', type=int, help='Number of people to create')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows generated and inserted at a time')
+        parser.add_argument('--workers', type=int, default=1, help='Processes generating rows')
+        parser.add_argument('--seed', type=int, help='Seed for reproducible data (default: random)')
 
     def handle(self, *args, **options):
         count = options['count']
+        batch_size = max(1, options['batch_size'])
+        seed = options['seed'] if options['seed'] is not None else random.randrange(2**32)
+        started = time.monotonic()
+
+        self.truncate()
+
+        created = 0
+        for rows in self.generate(seed, chunk_sizes(count, batch_size), options['workers']):
+            self.insert(rows)
+            created += len(rows)
+            self.stdout.write(f'{created} people created')
+        # Neither the truncate nor the bulk inserts send signals
+        bump_people_version()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully created {count} people in {elapsed:.1f}s with seed {seed} '
+                f'({count / max(elapsed, 0.001):,.0f} rows/s)'
+            )
+        )
+
+    def truncate(self):
+        # TRUNCATE where the database has it, resetting the id sequence so
+        # that a seed gives the same ids too; no rows are fetched or signalled
+        tables = [Person._meta.db_table, PersonTombstone._meta.db_table]
+        connection.ops.execute_sql_flush(connection.ops.sql_flush(no_style(), tables, reset_sequences=True))
+
+    def generate(self, seed, chunks, workers):
+        """Yield generated chunks in order, keeping a few in flight so that memory stays bounded"""
+        if workers <= 1:
+            for index, size in chunks:
+                yield generate_chunk(seed, index, size)
+            return
 
-        Person.objects.all().delete()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for index, size in chunks:
+                pending.append(pool.submit(generate_chunk, seed, index, size))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
 
-        PersonFactory.create_batch(count)
+    def insert(self, rows):
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                self.copy(rows)
+            else:
+                Person.objects.bulk_create([Person(**dict(zip(COLUMNS, row))) for row in rows])
 
-        self.stdout.write(self.style.SUCCESS(f'Successfully created {count} people'))
+    def copy(self, rows):
+        """Insert rows with COPY, which PostgreSQL loads far faster than INSERTs"""
+        now = timezone.now()
+        sql = f'COPY {Person._meta.db_table} ({", ".join(COLUMNS)}, created_at, updated_at) FROM STDIN'
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy'):
+                # psycopg 3
+                with raw.copy(sql) as copy:
+                    for row in rows:
+                        copy.write_row((*row, now, now))
+            else:
+                # psycopg2
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for row in rows:
+                    writer.writerow((*row, now.isoformat(), now.isoformat()))
+                buffer.seek(0)
+                raw.copy_expert(f'{sql} WITH (FORMAT csv)', buffer)
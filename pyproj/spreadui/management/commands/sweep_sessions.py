@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from spreadui.leases import sweep_leases
+from spreadui.locks import get_lock_backend
+from spreadui.models import PersonTombstone
+from spreadui.sync import TOMBSTONE_RETENTION
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete lapsed editing sessions and row leases, and tombstones older than the delta sync retention.  '
+        'Run it from cron, or with --interval to keep sweeping.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, help='Keep running, sweeping every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            self.sweep()
+            if not interval:
+                break
+            time.sleep(interval)
+
+    def sweep(self):
+        sessions = get_lock_backend().sweep()
+        leases = sweep_leases()
+        tombstones, _ = PersonTombstone.objects.filter(deleted_at__lt=timezone.now() - TOMBSTONE_RETENTION).delete()
+        self.stdout.write(
+            f'Deleted {sessions} lapsed session(s), {leases} lapsed lease(s) and {tombstones} old tombstone(s)'
+        )
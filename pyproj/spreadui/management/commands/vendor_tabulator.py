@@ -0,0 +1,59 @@
+import base64
+import hashlib
+import io
+import json
+import tarfile
+import urllib.request
+from pathlib import Path
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+TABULATOR_VERSION = '6.2.1'
+REGISTRY_URL = 'https://registry.npmjs.org/tabulator-tables'
+
+# Files copied out of the npm package.  The source maps are needed because
+# ManifestStaticFilesStorage follows the sourceMappingURL comments.
+FILES = (
+    'dist/js/tabulator.min.js',
+    'dist/js/tabulator.min.js.map',
+    'dist/css/tabulator.min.css',
+    'dist/css/tabulator.min.css.map',
+    'LICENSE',
+)
+
+
+def vendor_dir():
+    return Path(apps.get_app_config('spreadui').path) / 'static' / 'spreadui' / 'vendor' / 'tabulator'
+
+
+class Command(BaseCommand):
+    help = (
+        f'Download Tabulator {TABULATOR_VERSION} from the npm registry into spreadui/static/spreadui/vendor, '
+        'so the sheet page can be served without a third-party CDN.  Commit the files it writes, then point '
+        'sheet.html at them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tabulator-version', default=TABULATOR_VERSION)
+
+    def handle(self, *args, **options):
+        version = options['tabulator_version']
+        with urllib.request.urlopen(f'{REGISTRY_URL}/{version}') as response:
+            dist = json.load(response)['dist']
+        with urllib.request.urlopen(dist['tarball']) as response:
+            tarball = response.read()
+
+        algorithm, _, expected = dist['integrity'].partition('-')
+        if base64.b64encode(hashlib.new(algorithm, tarball).digest()).decode() != expected:
+            raise CommandError(f'{dist["tarball"]} does not match its {algorithm} integrity hash')
+
+        target = vendor_dir()
+        target.mkdir(parents=True, exist_ok=True)
+        with tarfile.open(fileobj=io.BytesIO(tarball)) as archive:
+            for name in FILES:
+                member = archive.extractfile(f'package/{name}')
+                if member is None:
+                    raise CommandError(f'Tabulator {version} has no {name}')
+                (target / Path(name).name).write_bytes(member.read())
+                self.stdout.write(f'Wrote {target / Path(name).name}')
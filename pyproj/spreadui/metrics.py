@@ -0,0 +1,157 @@
+"""
+In-process metrics, exposed in the Prometheus text format at /metrics.
+
+Each worker process keeps its own counters and histograms, so with several
+workers Prometheus should scrape each one (or sum them).  Recording a value
+is a dictionary lookup and a few additions under a lock, so metrics are
+cheap enough to leave on; set SPREADUI_METRICS = False to turn them off.
+"""
+
+import bisect
+import threading
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def metrics_enabled():
+    return getattr(settings, "SPREADUI_METRICS", True)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        # labels -> [count per bucket (the last being +Inf), sum]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def count(self, **labels):
+        entry = self._values.get(tuple(labels[name] for name in self.labelnames))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.add(
+    Histogram(
+        "spreadui_request_duration_seconds",
+        "Time to produce a response, by route",
+        LATENCY_BUCKETS,
+        ("route", "method", "status"),
+    )
+)
+REQUEST_QUERIES = registry.add(
+    Histogram("spreadui_request_queries", "Database queries per request, by route", QUERY_COUNT_BUCKETS, ("route",))
+)
+REQUEST_QUERY_DURATION = registry.add(
+    Histogram(
+        "spreadui_request_query_duration_seconds",
+        "Time spent in database queries per request, by route",
+        LATENCY_BUCKETS,
+        ("route",),
+    )
+)
+RESPONSE_SIZE = registry.add(
+    Histogram(
+        "spreadui_response_size_bytes",
+        "Size of non-streaming response bodies, by route",
+        SIZE_BUCKETS,
+        ("route",),
+    )
+)
+LOCK_EVENTS = registry.add(
+    Counter(
+        "spreadui_lock_events_total",
+        "Editing lock (lock=sheet) and row lease (lock=rows) outcomes: "
+        "acquired, denied, released, or expired when a keepalive found the lock gone",
+        ("lock", "event"),
+    )
+)
+
+
+def record_lock_event(lock, event):
+    if metrics_enabled():
+        LOCK_EVENTS.inc(lock=lock, event=event)
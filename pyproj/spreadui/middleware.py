@@ -0,0 +1,210 @@
+import contextvars
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.messages.middleware import MessageMiddleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware.clickjacking import XFrameOptionsMiddleware
+from django.middleware.common import CommonMiddleware
+from django.middleware.csrf import CsrfViewMiddleware
+from django.middleware.gzip import GZipMiddleware
+
+from .metrics import REQUEST_DURATION, REQUEST_QUERIES, REQUEST_QUERY_DURATION, RESPONSE_SIZE, metrics_enabled
+from .routers import STICKY_COOKIE, ReadState, read_replicas, read_state, sticky_seconds
+
+
+# The API routes every open tab polls every few seconds
+FAST_PATHS = ("/api/session/status", "/api/people/changes")
+
+
+def fast_paths():
+    return getattr(settings, "SPREADUI_FAST_PATHS", FAST_PATHS)
+
+
+class QueryRecorder:
+    """An execute wrapper that counts and times the queries it sees"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+# The recorder for the current request.  Under ASGI even sync views run their
+# queries in sync_to_async() threads, on those threads' own connections; the
+# threads get a copy of this context, so they still find the recorder.
+query_recorder = contextvars.ContextVar("spreadui_query_recorder", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """An execute wrapper, installed on every connection, that passes queries to the current request's recorder"""
+    recorder = query_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection):
+    if metrics_enabled() and record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def route_of(request):
+    """The URL pattern that handled the request, which keeps metric labels few"""
+    match = getattr(request, "resolver_match", None)
+    return match.route if match else "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Records each request's latency, database queries and response size by
+    route, and reports the same figures to the browser in a Server-Timing
+    header.  Queries are seen through record_query(), which
+    spreadui.signals installs on each database connection as it is made.
+    Queries a streaming response makes after the view returns aren't counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        recorder = QueryRecorder()
+        token = query_recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            query_recorder.reset(token)
+        self.record(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        recorder = QueryRecorder()
+        token = query_recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            query_recorder.reset(token)
+        self.record(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    def record(self, request, response, seconds, recorder):
+        route = route_of(request)
+        REQUEST_DURATION.observe(seconds, route=route, method=request.method, status=response.status_code)
+        REQUEST_QUERIES.observe(recorder.count, route=route)
+        REQUEST_QUERY_DURATION.observe(recorder.seconds, route=route)
+        response["Server-Timing"] = (
+            f'app;dur={seconds * 1000:.1f}, db;dur={recorder.seconds * 1000:.1f};desc="{recorder.count} queries"'
+        )
+        if not response.streaming:
+            RESPONSE_SIZE.observe(len(response.content), route=route)
+
+
+class ApiGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware for the JSON API only.
+
+    Pages are left alone, because compressing responses that contain the CSRF
+    token exposes it to BREACH.  The event stream is left alone too, so each
+    event reaches the browser as soon as it is sent.
+    """
+
+    def process_response(self, request, response):
+        if not request.path.startswith("/api/") or response.get("Content-Type", "").startswith("text/event-stream"):
+            return response
+        return super().process_response(request, response)
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Keeps a client that has written rows reading from the primary database
+    until the replicas have caught up; see spreadui.routers.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not read_replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self.begin(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_state.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        state, token = self.begin(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_state.reset(token)
+        return self.finish(state, response)
+
+    def begin(self, request):
+        # Requests that may write read from the primary too, so that they
+        # check and update the current rows
+        state = ReadState(pinned=STICKY_COOKIE in request.COOKIES or request.method not in ("GET", "HEAD", "OPTIONS"))
+        return state, read_state.set(state)
+
+    def finish(self, state, response):
+        if state.wrote:
+            response.set_cookie(STICKY_COOKIE, "1", max_age=sticky_seconds(), httponly=True, samesite="Lax")
+        return response
+
+
+class FastPathMixin:
+    """
+    Skips a middleware for requests to SPREADUI_FAST_PATHS.
+
+    Only for middleware those routes have no use for: Ninja views are CSRF
+    exempt, the API sends no messages and its JSON is never framed.  They
+    still go through sessions, authentication and the login check.
+    """
+
+    def __call__(self, request):
+        if request.path in fast_paths():
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class FastPathCommonMiddleware(FastPathMixin, CommonMiddleware):
+    pass
+
+
+class FastPathCsrfViewMiddleware(FastPathMixin, CsrfViewMiddleware):
+    pass
+
+
+class FastPathMessageMiddleware(FastPathMixin, MessageMiddleware):
+    pass
+
+
+class FastPathXFrameOptionsMiddleware(FastPathMixin, XFrameOptionsMiddleware):
+    pass
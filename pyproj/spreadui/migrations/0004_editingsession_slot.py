@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:34
+
+from django.db import migrations, models
+
+
+def clear_sessions(apps, schema_editor):
+    # Sessions last 30 seconds, and any leftovers would all want slot 1
+    apps.get_model("spreadui", "EditingSession").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("spreadui", "0003_person_sync"),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_sessions, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name="editingsession",
+            name="slot",
+            field=models.PositiveSmallIntegerField(default=1, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("spreadui", "0004_editingsession_slot"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="editingsession",
+            name="last_keepalive",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
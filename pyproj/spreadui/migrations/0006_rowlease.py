@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("spreadui", "0005_editingsession_last_keepalive_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RowLease",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("uuid", models.CharField(db_index=True, max_length=36)),
+                ("first_id", models.BigIntegerField(db_index=True)),
+                ("last_id", models.BigIntegerField()),
+                ("last_keepalive", models.DateTimeField(auto_now=True, db_index=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
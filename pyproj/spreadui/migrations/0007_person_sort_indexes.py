@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("spreadui", "0006_rowlease"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="person",
+            index=models.Index(fields=["last_name", "id"], name="person_last_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="person",
+            index=models.Index(
+                fields=["first_name", "id"], name="person_first_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="person",
+            index=models.Index(fields=["email", "id"], name="person_email_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="person",
+            index=models.Index(fields=["age", "id"], name="person_age_idx"),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:02
+
+from django.db import migrations
+
+# SQLite: an external-content FTS5 table over the searchable columns, kept in
+# step with spreadui_person by triggers so that bulk writes are covered too.
+SQLITE_FORWARDS = [
+    """
+    CREATE VIRTUAL TABLE spreadui_person_fts USING fts5(
+        first_name, last_name, email, content='spreadui_person', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER spreadui_person_fts_insert AFTER INSERT ON spreadui_person BEGIN
+        INSERT INTO spreadui_person_fts(rowid, first_name, last_name, email)
+        VALUES (new.id, new.first_name, new.last_name, new.email);
+    END
+    """,
+    """
+    CREATE TRIGGER spreadui_person_fts_delete AFTER DELETE ON spreadui_person BEGIN
+        INSERT INTO spreadui_person_fts(spreadui_person_fts, rowid, first_name, last_name, email)
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+    END
+    """,
+    """
+    CREATE TRIGGER spreadui_person_fts_update AFTER UPDATE OF first_name, last_name, email ON spreadui_person BEGIN
+        INSERT INTO spreadui_person_fts(spreadui_person_fts, rowid, first_name, last_name, email)
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+        INSERT INTO spreadui_person_fts(rowid, first_name, last_name, email)
+        VALUES (new.id, new.first_name, new.last_name, new.email);
+    END
+    """,
+    "INSERT INTO spreadui_person_fts(spreadui_person_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS spreadui_person_fts_insert",
+    "DROP TRIGGER IF EXISTS spreadui_person_fts_delete",
+    "DROP TRIGGER IF EXISTS spreadui_person_fts_update",
+    "DROP TABLE IF EXISTS spreadui_person_fts",
+]
+
+# PostgreSQL: a GIN index on the same expression spreadui.search queries with
+POSTGRESQL_FORWARDS = [
+    """
+    CREATE INDEX spreadui_person_search_idx ON spreadui_person
+    USING GIN (to_tsvector('simple', first_name || ' ' || last_name || ' ' || email))
+    """,
+]
+
+POSTGRESQL_BACKWARDS = [
+    "DROP INDEX IF EXISTS spreadui_person_search_idx",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("spreadui", "0007_person_sort_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({"sqlite": SQLITE_FORWARDS, "postgresql": POSTGRESQL_FORWARDS}),
+            run({"sqlite": SQLITE_BACKWARDS, "postgresql": POSTGRESQL_BACKWARDS}),
+        ),
+    ]
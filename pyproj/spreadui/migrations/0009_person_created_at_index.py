@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("spreadui", "0008_person_search"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="person",
+            index=models.Index(
+                fields=["created_at", "id"], name="person_created_at_idx"
+            ),
+        ),
+    ]
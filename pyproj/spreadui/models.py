@@ -8,18 +8,41 @@ class Person(models.Model):
     email = models.EmailField()
     age = models.PositiveIntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         verbose_name_plural = "People"
+        # Each sortable column is indexed together with id, matching the
+        # (column, id) ordering that keyset pagination walks.
+        indexes = [
+            models.Index(fields=["last_name", "id"], name="person_last_name_idx"),
+            models.Index(fields=["first_name", "id"], name="person_first_name_idx"),
+            models.Index(fields=["email", "id"], name="person_email_idx"),
+            models.Index(fields=["age", "id"], name="person_age_idx"),
+            # For the admin's date hierarchy and created_at filter
+            models.Index(fields=["created_at", "id"], name="person_created_at_idx"),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
 
+class PersonTombstone(models.Model):
+    """Records a deleted Person so that delta sync can tell clients to drop the row"""
+
+    person_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Tombstone for person {self.person_id}"
+
+
 class EditingSession(models.Model):
+    # There is one editing lock, so every session takes slot 1.  The unique
+    # constraint means two tabs racing to claim a free lock can't both succeed.
+    slot = models.PositiveSmallIntegerField(default=1, unique=True)
     uuid = models.CharField(max_length=36, unique=True)  # UUID length
-    last_keepalive = models.DateTimeField(auto_now=True)
+    last_keepalive = models.DateTimeField(auto_now=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def is_active(self):
@@ -29,3 +52,22 @@ class EditingSession(models.Model):
 
     def __str__(self):
         return f"Session {self.uuid[:8]}..."
+
+
+class RowLease(models.Model):
+    """
+    A claim by one browser tab on the Person rows with ids first_id..last_id.
+
+    Live leases never overlap, so a conflict check only has to look at the
+    leases starting inside a range and the one lease starting just before it.
+    Both are index seeks on first_id.
+    """
+
+    uuid = models.CharField(max_length=36, db_index=True)
+    first_id = models.BigIntegerField(db_index=True)
+    last_id = models.BigIntegerField()
+    last_keepalive = models.DateTimeField(auto_now=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Lease on rows {self.first_id}-{self.last_id} for {self.uuid[:8]}..."
@@ -0,0 +1,36 @@
+"""
+JSON rendering for the API.
+
+NinjaAPI's default renderer encodes responses with json.dumps and
+NinjaJSONEncoder.  With SPREADUI_FAST_JSON = True and orjson installed,
+responses are encoded by orjson instead, which is several times faster for
+the large row lists the sheet loads (see the bench_render command).  Types
+orjson doesn't know, and datetimes, are still handed to NinjaJSONEncoder,
+so both renderers encode values the same way; orjson just leaves out the
+spaces after separators.  Without orjson the setting is ignored.
+"""
+
+from django.conf import settings
+from ninja.renderers import JSONRenderer
+from ninja.responses import NinjaJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def fast_json_enabled():
+    return orjson is not None and getattr(settings, "SPREADUI_FAST_JSON", False)
+
+
+class ORJSONRenderer(JSONRenderer):
+    def __init__(self):
+        self._default = NinjaJSONEncoder().default
+
+    def render(self, request, data, *, response_status):
+        return orjson.dumps(data, default=self._default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+def get_renderer():
+    return ORJSONRenderer() if fast_json_enabled() else JSONRenderer()
@@ -0,0 +1,77 @@
+"""
+Sending reads of the sheet's rows to read replicas.
+
+Reads of Person and PersonTombstone go to a random database named in
+SPREADUI_READ_REPLICAS; everything else, including all writes and the
+editing lock and row leases, stays on the default database.  Replicas lag
+the primary, so requests that may write (anything but GET, HEAD and
+OPTIONS) read from the primary, and a client that has just written rows
+keeps reading from it for SPREADUI_REPLICA_STICKY_SECONDS afterwards: the
+router notes the write, and ReplicaStickinessMiddleware turns that into a
+cookie.  Viewers' change
+polls tolerate lag up to sync.SYNC_OVERLAP, and the sticky period defaults
+to the same.
+"""
+
+import contextvars
+import random
+
+from django.conf import settings
+
+from .sync import SYNC_OVERLAP
+
+REPLICATED_MODELS = {"spreadui.person", "spreadui.persontombstone"}
+
+STICKY_COOKIE = "spreadui_primary"
+
+
+class ReadState:
+    """Whether the current request must read from the primary, and whether it has written rows"""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# Set per request by ReplicaStickinessMiddleware.  It holds a mutable
+# object rather than flags, so writes noted in a sync_to_async() thread are
+# seen by the middleware.
+read_state = contextvars.ContextVar("spreadui_read_state", default=None)
+
+
+def read_replicas():
+    return getattr(settings, "SPREADUI_READ_REPLICAS", [])
+
+
+def sticky_seconds():
+    return getattr(settings, "SPREADUI_REPLICA_STICKY_SECONDS", int(SYNC_OVERLAP.total_seconds()))
+
+
+def reads_from_primary():
+    """Whether the current request reads the rows from the primary database"""
+    if not read_replicas():
+        return True
+    state = read_state.get()
+    return bool(state and (state.pinned or state.wrote))
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in REPLICATED_MODELS or not read_replicas():
+            return None
+        if reads_from_primary():
+            return "default"
+        return random.choice(read_replicas())
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label_lower not in REPLICATED_MODELS:
+            return None
+        state = read_state.get()
+        if state:
+            state.wrote = True
+        # Not None, which would write rows read from a replica back to it
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
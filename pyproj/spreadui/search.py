@@ -0,0 +1,98 @@
+"""
+Indexed full-text search over people's names and email addresses.
+
+On SQLite the search goes through the spreadui_person_fts FTS5 table, and on
+PostgreSQL through a GIN tsvector index; both are created by migration 0008.
+Every word of the query must match the start of a word in a row.  Other
+databases fall back to unindexed icontains lookups.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Person
+
+DEFAULT_SEARCH_SIZE = 50
+MAX_SEARCH_SIZE = 200
+
+SEARCH_FIELDS = ("first_name", "last_name", "email")
+
+# Must match the expression indexed by migration 0008
+POSTGRESQL_VECTOR = "to_tsvector('simple', first_name || ' ' || last_name || ' ' || email)"
+
+_WORD = re.compile(r"\w+")
+
+
+def search_words(text):
+    return _WORD.findall(text.lower())
+
+
+def _match_sql(words):
+    """
+    Return (sql, params, rank) selecting the ids of people matching all of words,
+    where rank is an SQL expression to order the matches by, best first.
+    """
+    if connection.vendor == "sqlite":
+        query = " ".join(f'"{word}"*' for word in words)
+        return "SELECT rowid FROM spreadui_person_fts WHERE spreadui_person_fts MATCH %s", [query], "rank"
+    query = " & ".join(f"{word}:*" for word in words)
+    return (
+        f"SELECT id FROM spreadui_person WHERE {POSTGRESQL_VECTOR} @@ to_tsquery('simple', %s)",
+        [query],
+        f"ts_rank({POSTGRESQL_VECTOR}, to_tsquery('simple', %s)) DESC",
+    )
+
+
+def filter_people(queryset, text):
+    """Narrow a Person queryset to those matching text, using the search index where there is one"""
+    words = search_words(text)
+    if not words:
+        return queryset
+    if connection.vendor not in ("sqlite", "postgresql"):
+        for word in words:
+            queryset = queryset.filter(Q(**{f"{field}__icontains": word for field in SEARCH_FIELDS}, _connector=Q.OR))
+        return queryset
+    sql, params, _ = _match_sql(words)
+    return queryset.filter(id__in=RawSQL(sql, params))
+
+
+def search_people(text, page=1, size=DEFAULT_SEARCH_SIZE):
+    """
+    Return (rows, has_more) for one page of the people matching text, best matches first.
+
+    Ranked results have no stable key to seek on, so pages are found with
+    OFFSET; searches are expected to be narrowed rather than paged deeply.
+    Pages are numbered from 1; raises ValueError for a lower page.
+    """
+    if page < 1:
+        raise ValueError(f"Page {page} is out of range; pages start at 1")
+    words = search_words(text)
+    size = max(1, min(size, MAX_SEARCH_SIZE))
+    offset = (page - 1) * size
+    if not words:
+        return [], False
+
+    if connection.vendor == "sqlite":
+        sql, params, rank = _match_sql(words)
+        ranked = f"{sql} ORDER BY {rank}, rowid LIMIT %s OFFSET %s"
+    elif connection.vendor == "postgresql":
+        sql, params, rank = _match_sql(words)
+        ranked = f"{sql} ORDER BY {rank}, id LIMIT %s OFFSET %s"
+        params = params + params
+    else:
+        ids = filter_people(Person.objects.order_by("id"), text).values_list("id", flat=True)
+        ids = list(ids[offset : offset + size + 1])
+        ranked = None
+
+    if ranked:
+        with connection.cursor() as cursor:
+            cursor.execute(ranked, [*params, size + 1, offset])
+            ids = [row[0] for row in cursor.fetchall()]
+
+    has_more = len(ids) > size
+    ids = ids[:size]
+    people = Person.objects.in_bulk(ids)
+    return [people[i] for i in ids if i in people], has_more
@@ -0,0 +1,43 @@
+"""
+Fake people for seeding the database, generated in reproducible chunks.
+
+Names are drawn from Faker's weighted en_US name lists, the same ones
+PersonFactory uses, but a whole chunk at a time with random.choices()
+rather than one Faker call per field, which is around a hundred times
+faster.  Each chunk has its own seed, derived from the run's seed and the
+chunk's index, so a given seed and batch size give the same people however
+many worker processes share the work.  Nothing here touches Django, so
+chunks can be generated in worker processes whatever their start method.
+"""
+
+import random
+
+from faker.providers.person.en_US import Provider as PersonProvider
+
+AGES = range(18, 81)
+
+FIRST_NAMES = list(PersonProvider.first_names)
+FIRST_NAME_WEIGHTS = list(PersonProvider.first_names.values())
+LAST_NAMES = list(PersonProvider.last_names)
+LAST_NAME_WEIGHTS = list(PersonProvider.last_names.values())
+
+
+def chunk_seed(seed, index):
+    return seed * 1_000_003 + index
+
+
+def generate_chunk(seed, index, count):
+    """Return count (first_name, last_name, email, age) tuples, like the people PersonFactory makes"""
+    rng = random.Random(chunk_seed(seed, index))
+    first_names = rng.choices(FIRST_NAMES, FIRST_NAME_WEIGHTS, k=count)
+    last_names = rng.choices(LAST_NAMES, LAST_NAME_WEIGHTS, k=count)
+    ages = rng.choices(AGES, k=count)
+    return [
+        (first_name, last_name, f"{first_name.lower()}.{last_name.lower()}@example.com", age)
+        for first_name, last_name, age in zip(first_names, last_names, ages)
+    ]
+
+
+def chunk_sizes(count, batch_size):
+    """Split count rows into (index, size) chunks of at most batch_size"""
+    return [(index, min(batch_size, count - start)) for index, start in enumerate(range(0, count, batch_size))]
@@ -0,0 +1,23 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import bump_people_version
+from .middleware import install_query_recorder
+from .models import Person, PersonTombstone
+
+
+@receiver(post_delete, sender=Person)
+def record_person_tombstone(sender, instance, **kwargs):
+    PersonTombstone.objects.create(person_id=instance.id)
+
+
+@receiver(post_save, sender=Person)
+@receiver(post_delete, sender=Person)
+def retire_cached_people(sender, **kwargs):
+    bump_people_version()
+
+
+@receiver(connection_created)
+def record_queries_for_metrics(sender, connection, **kwargs):
+    install_query_recorder(connection)
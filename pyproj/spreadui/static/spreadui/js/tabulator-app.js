@@ -6,6 +6,44 @@ document.addEventListener('DOMContentLoaded', function() {
     let isEditing = false;
     let sessionUUID = null;
 
+    // Rows are fetched a page at a time as the user scrolls.  The server uses
+    // keyset pagination, so we remember the cursor that continues after each
+    // page Tabulator has asked for.
+    const PAGE_SIZE = 100;
+
+    // Edits made within this many milliseconds of each other (eg: a paste)
+    // are sent to the server in one bulk request.
+    const EDIT_COALESCE_MS = 250;
+    let pendingEdits = {};
+    let flushTimer = null;
+    let pageCursors = {1: null};
+    let allPagesLoaded = false;
+
+    // Viewers stay current by asking for rows changed since a watermark the
+    // server issued, rather than reloading the whole table.
+    let syncWatermark = null;
+    let syncInterval = null;
+
+    // Lock and row changes are pushed over Server-Sent Events.  While the
+    // stream is open we only poll occasionally, to catch anything published
+    // by another server process; if it drops we poll quickly until it's back.
+    const FAST_STATUS_POLL = 3000;
+    const SLOW_STATUS_POLL = 60000;
+    const FAST_SYNC_POLL = 10000;
+    const SLOW_SYNC_POLL = 60000;
+    let eventSource = null;
+
+    // Who holds the lock, and when it lapses unless they extend it.  The
+    // countdown is kept locally so it needs no server round trips.
+    let lockEditor = null;
+    let lockExpiresAt = null;
+    let lockTicker = null;
+
+    // Row-range leases let several people edit different rows at once.
+    // Double-clicking a row while not editing the whole sheet leases it.
+    let myLeases = [];
+    let otherLeases = [];
+
     // Generate UUID for this browser tab
     function generateUUID() {
         return 'xxxxxxxx-xxxx-4xxx-yxxx-xxxxxxxxxxxx'.replace(/[xy]/g, function(c) {
@@ -66,34 +104,136 @@ document.addEventListener('DOMContentLoaded', function() {
         return editor;
     }
 
+    // Column metadata from /api/people/columns.  Hidden columns are left out
+    // of the fields= projection, so they are neither queried nor sent.
+    let columnMeta = [];
+    const hiddenFields = new Set();
+
+    async function loadColumns() {
+        const response = await fetch('/api/people/columns');
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        columnMeta = await response.json();
+    }
+
+    function visibleFields() {
+        return columnMeta.map(column => column.field).filter(field => !hiddenFields.has(field));
+    }
+
+    function editableFields() {
+        return columnMeta.filter(column => column.editable).map(column => column.field)
+            .filter(field => !hiddenFields.has(field));
+    }
+
+    // Build Tabulator column definitions from the column metadata
+    function buildColumns() {
+        return columnMeta.map(function(column) {
+            const definition = {
+                title: column.title,
+                field: column.field,
+                visible: !hiddenFields.has(column.field),
+                headerSort: column.sortable,
+                headerMenu: columnMenu,
+            };
+            if (column.field === "id") {
+                definition.width = 80;
+            }
+            if (column.filter) {
+                definition.headerFilter = "input";
+                definition.headerFilterFunc = column.filter;
+            }
+            if (column.editable) {
+                definition.editor = column.type === "integer" ? numericEditor : "input";
+                definition.editable = canEditCell;
+                if (column.type === "integer") {
+                    definition.validator = "integer";
+                }
+            }
+            return definition;
+        });
+    }
+
+    // Header menu for hiding a column, or showing a hidden one again
+    function columnMenu(e, column) {
+        const items = [];
+        if (column.getField() !== "id") {
+            items.push({label: "Hide column", action: () => hideColumn(column.getField())});
+        }
+        columnMeta.filter(meta => hiddenFields.has(meta.field)).forEach(function(meta) {
+            items.push({label: `Show ${meta.title}`, action: () => showColumn(meta.field)});
+        });
+        return items;
+    }
+
+    function hideColumn(field) {
+        hiddenFields.add(field);
+        table.hideColumn(field);
+    }
+
+    function showColumn(field) {
+        hiddenFields.delete(field);
+        table.showColumn(field);
+        // The loaded rows don't have this column's values
+        loadData();
+    }
+
     // Initialize Tabulator
     function initializeTable(readOnly = true) {
-        const columns = [
-            {title: "ID", field: "id", width: 80},
-            {title: "First Name", field: "first_name", editor: readOnly ? false : "input"},
-            {title: "Last Name", field: "last_name", editor: readOnly ? false : "input"},
-            {title: "Email", field: "email", editor: readOnly ? false : "input"},
-            {title: "Age", field: "age", editor: readOnly ? false : numericEditor, validator: "integer"},
-        ];
+        // Cells are editable by the whole-sheet editor, or in rows we have leased.
+        // Sorting and header filters are applied by the server.
+        const columns = buildColumns();
 
         if (table) {
             table.destroy();
         }
 
+        pageCursors = {1: null};
+        allPagesLoaded = false;
+        resetSyncWatermark();
+
         table = new Tabulator("#spreadsheet-table", {
             layout: "fitColumns",
+            // Allow selecting, copying and pasting blocks of cells while editing
+            selectableRange: !readOnly,
+            clipboard: !readOnly,
+            clipboardPasteAction: "range",
             height: "600px",
             columns: columns,
-            data: [],
             placeholder: "Loading data...",
+            ajaxURL: '/api/people/page',
+            progressiveLoad: "scroll",
+            sortMode: "remote",
+            filterMode: "remote",
+            paginationSize: PAGE_SIZE,
+            ajaxURLGenerator: buildPageURL,
+            ajaxResponse: handlePageResponse,
+            rowFormatter: formatLeasedRow,
+        });
+
+        // Cell edited - queue it to be saved, which also extends the session or lease
+        table.on("cellEdited", function(cell) {
+            queueEdit(cell.getRow().getData().id, cell.getField(), cell.getValue());
         });
 
+        if (readOnly) {
+            // Row double-clicked - lease it so it can be edited
+            table.on("cellDblClick", function(e, cell) {
+                const id = cell.getRow().getData().id;
+                if (!ownsRow(id) && !leasedByOther(id)) {
+                    leaseRow(cell);
+                }
+            });
+        }
+
         // Add event handlers for user interaction
         if (!readOnly) {
-            // Cell edited - save data
-            table.on("cellEdited", function(cell) {
-                saveRow(cell.getRow().getData());
-                extendEditingSession(); // Extend session on edit
+            // Block pasted - queue every editable cell of the rows it touched
+            table.on("clipboardPasted", function(clipboard, rowData, rows) {
+                rows.forEach(function(row) {
+                    const data = row.getData();
+                    editableFields().forEach(field => queueEdit(data.id, field, data[field]));
+                });
             });
 
             // Cell clicked - extend session
@@ -107,49 +247,249 @@ document.addEventListener('DOMContentLoaded', function() {
             });
         }
 
-        loadData();
     }
 
-    // Fetch data from API
-    async function loadData() {
+    function ownsRow(id) {
+        return myLeases.some(lease => lease.first_id <= id && id <= lease.last_id);
+    }
+
+    function leasedByOther(id) {
+        return otherLeases.some(lease => lease.first_id <= id && id <= lease.last_id);
+    }
+
+    function canEditCell(cell) {
+        return isEditing || ownsRow(cell.getRow().getData().id);
+    }
+
+    // Shade rows that we, or other people, have leased
+    function formatLeasedRow(row) {
+        const id = row.getData().id;
+        row.getElement().classList.toggle('row-leased-mine', ownsRow(id));
+        row.getElement().classList.toggle('row-leased-other', leasedByOther(id));
+    }
+
+    // Record the live leases, as reported by a status poll or a pushed event
+    function setLeases(leases) {
+        const myPrefix = sessionUUID.substring(0, 8) + '...';
+        myLeases = leases.filter(lease => lease.holder === myPrefix);
+        otherLeases = leases.filter(lease => lease.holder !== myPrefix);
+        if (myLeases.length === 0 && !isEditing) {
+            stopKeepalive();
+        }
+        document.getElementById('lease-info').style.display = myLeases.length && !isEditing ? 'block' : 'none';
+        table.getRows().forEach(row => row.reformat());
+    }
+
+    // Lease one row and start editing the cell that was double-clicked
+    async function leaseRow(cell) {
+        const id = cell.getRow().getData().id;
+        try {
+            const response = await fetch('/api/session/lease', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({uuid: sessionUUID, first_id: id, last_id: id})
+            });
+
+            const result = await response.json();
+            if (result.success) {
+                setLeases([...myLeases, ...otherLeases, {first_id: id, last_id: id, holder: sessionUUID.substring(0, 8) + '...'}]);
+                if (!keepaliveInterval) {
+                    startKeepalive();
+                }
+                cell.edit(true);
+            } else {
+                showToast(result.message || 'Cannot edit this row', 'warning');
+            }
+        } catch (error) {
+            console.error('Failed to lease row:', error);
+            showToast('Failed to lease row', 'danger');
+        }
+    }
+
+    // Give up all our leased rows
+    async function releaseLeases() {
+        if (flushTimer) {
+            clearTimeout(flushTimer);
+            await flushEdits();
+        }
+        try {
+            await fetch('/api/session/end', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({uuid: sessionUUID})
+            });
+        } catch (error) {
+            console.error('Failed to release rows:', error);
+        }
+        setLeases(otherLeases);
+    }
+
+    // Build the URL for the page Tabulator wants from the cursor saved for it,
+    // passing on the current sorters and filters
+    function buildPageURL(url, config, params) {
+        if (params.page === 1) {
+            // A new sort or filter starts again from the first page
+            pageCursors = {1: null};
+            allPagesLoaded = false;
+        }
+        const query = new URLSearchParams({size: PAGE_SIZE});
+        if (hiddenFields.size) {
+            query.set('fields', visibleFields().join(','));
+        }
+        const cursor = pageCursors[params.page];
+        if (cursor) {
+            query.set('after', cursor);
+        }
+        setSortFilterParams(query, params.sort, params.filter);
+        return `${url}?${query}`;
+    }
+
+    // Add sorters and filters to a query in Tabulator's remote format
+    function setSortFilterParams(query, sorters, filters) {
+        (sorters || []).forEach(function(sorter, i) {
+            query.set(`sort[${i}][field]`, sorter.field);
+            query.set(`sort[${i}][dir]`, sorter.dir);
+        });
+        (filters || []).forEach(function(filter, i) {
+            query.set(`filter[${i}][field]`, filter.field);
+            query.set(`filter[${i}][type]`, filter.type);
+            query.set(`filter[${i}][value]`, filter.value);
+        });
+    }
+
+    // Download the sheet as it is currently sorted and filtered
+    function exportSheet(format) {
+        const query = new URLSearchParams({format: format});
+        const sorters = table.getSorters().map(sorter => ({field: sorter.field, dir: sorter.dir}));
+        setSortFilterParams(query, sorters, table.getHeaderFilters());
+        window.location = `/api/people/export?${query}`;
+    }
+
+    // Convert a keyset page into the shape Tabulator's progressive loader expects
+    function handlePageResponse(url, params, response) {
+        const page = params.page;
+        if (response.next_cursor) {
+            pageCursors[page + 1] = response.next_cursor;
+        } else {
+            allPagesLoaded = true;
+        }
+        return {
+            last_page: response.next_cursor ? page + 1 : page,
+            data: response.data,
+        };
+    }
+
+    // Reload the table from the first page
+    function loadData() {
+        pageCursors = {1: null};
+        allPagesLoaded = false;
+        resetSyncWatermark();
+        table.setData();
+    }
+
+    // Get a fresh watermark to sync from, taken before the table loads
+    async function resetSyncWatermark() {
+        syncWatermark = null;
+        try {
+            const response = await fetch('/api/people/changes');
+            const result = await response.json();
+            syncWatermark = result.watermark;
+        } catch (error) {
+            console.error('Failed to get sync watermark:', error);
+        }
+    }
+
+    // Apply rows changed or deleted by other people since the last sync
+    async function syncChanges() {
+        // The editor holds the only lock, so nobody else can change rows under them
+        if (isEditing || !syncWatermark) return;
+
         try {
-            const response = await fetch('/api/people');
+            const response = await fetch(`/api/people/changes?since=${encodeURIComponent(syncWatermark)}`);
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
-            const data = await response.json();
-            table.setData(data);
+            const changes = await response.json();
+
+            if (changes.reset) {
+                loadData();
+                return;
+            }
+
+            applyChangedRows(changes.changed);
+            changes.deleted.forEach(function(id) {
+                const row = table.getRow(id);
+                if (row) {
+                    row.delete();
+                }
+            });
+            syncWatermark = changes.watermark;
         } catch (error) {
-            console.error('Failed to load data:', error);
+            console.error('Failed to sync changes:', error);
         }
     }
 
-    // Save row data to server
-    async function saveRow(rowData) {
-        if (!isEditing) return;
+    // Show new values for rows other people have changed
+    function applyChangedRows(rows) {
+        rows.forEach(function(rowData) {
+            if (ownsRow(rowData.id)) {
+                // Don't disturb rows we are editing ourselves
+                return;
+            }
+            if (table.getRow(rowData.id)) {
+                table.updateData([rowData]);
+            } else if (allPagesLoaded && !table.getHeaderFilters().length) {
+                // Rows beyond the loaded pages will arrive when the user scrolls to them,
+                // and we can't tell here whether a new row passes the filters
+                table.addData([rowData]);
+            }
+        });
+    }
+
+    // Queue a changed cell, to be saved with any others made in the next moment
+    function queueEdit(rowId, field, value) {
+        if (!isEditing && !ownsRow(rowId)) return;
+
+        pendingEdits[rowId] = pendingEdits[rowId] || {};
+        pendingEdits[rowId][field] = value;
+        if (!flushTimer) {
+            flushTimer = setTimeout(flushEdits, EDIT_COALESCE_MS);
+        }
+    }
+
+    // Save all queued edits in one bulk request
+    async function flushEdits() {
+        flushTimer = null;
+        const rows = Object.entries(pendingEdits).map(([id, fields]) => ({id: Number(id), ...fields}));
+        pendingEdits = {};
+        if (rows.length === 0 || (!isEditing && myLeases.length === 0)) return;
 
         try {
-            const response = await fetch(`/api/people/${rowData.id}`, {
-                method: 'PUT',
+            const response = await fetch('/api/people/bulk', {
+                method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({
-                    uuid: sessionUUID,
-                    first_name: rowData.first_name,
-                    last_name: rowData.last_name,
-                    email: rowData.email,
-                    age: rowData.age
-                })
+                body: JSON.stringify({uuid: sessionUUID, rows: rows})
             });
 
             const result = await response.json();
-            if (!result.success) {
-                console.error('Failed to save row:', result.message);
-                showToast('Error saving data: ' + result.message, 'danger');
+            if (result.success) {
+                if (isEditing) {
+                    setOwnLockState(); // Saving extends the session
+                }
+            } else {
+                const failures = (result.results || []).filter(r => !r.success);
+                const message = result.message || failures.map(r => `row ${r.id}: ${r.message}`).join(', ');
+                console.error('Failed to save rows:', message);
+                showToast('Error saving data: ' + message, 'danger');
             }
         } catch (error) {
-            console.error('Failed to save row:', error);
+            console.error('Failed to save rows:', error);
             showToast('Error saving data', 'danger');
         }
     }
@@ -161,18 +501,92 @@ document.addEventListener('DOMContentLoaded', function() {
             const response = await fetch(`/api/session/status?uuid=${sessionUUID}`);
             const status = await response.json();
 
-            updateSessionUI(status);
-
-            if (isEditing && !status.can_edit) {
-                // We lost editing privileges - session expired
-                endEditingSession();
-                showToast('Editing session expired - switching to read-only mode', 'warning');
-            }
+            setLockState(status);
+            setLeases(status.leases || []);
         } catch (error) {
             console.error('Failed to check session status:', error);
         }
     }
 
+    // Record who holds the lock, as reported by a status poll or a pushed event
+    function setLockState(status) {
+        lockEditor = status.current_editor || null;
+        if (lockEditor && status.time_remaining !== null && status.time_remaining !== undefined) {
+            lockExpiresAt = Date.now() + status.time_remaining * 1000;
+        } else {
+            lockExpiresAt = null;
+        }
+        refreshLockState();
+    }
+
+    // Work out our own session status from the last known lock state
+    function refreshLockState() {
+        let editor = lockEditor;
+        let timeRemaining;
+        if (editor && lockExpiresAt !== null) {
+            timeRemaining = Math.max(0, Math.round((lockExpiresAt - Date.now()) / 1000));
+            if (timeRemaining <= 0 && !isEditing) {
+                // Someone else's lock has lapsed
+                editor = null;
+                timeRemaining = undefined;
+            }
+        }
+        const isMine = editor !== null && editor === sessionUUID.substring(0, 8) + '...';
+        const status = {
+            can_edit: editor === null || isMine,
+            current_editor: editor,
+            time_remaining: timeRemaining,
+        };
+
+        updateSessionUI(status);
+
+        if (isEditing && !status.can_edit) {
+            // We lost editing privileges - session expired
+            endEditingSession();
+            showToast('Editing session expired - switching to read-only mode', 'warning');
+        }
+    }
+
+    // We hold the lock for another full timeout
+    function setOwnLockState() {
+        setLockState({current_editor: sessionUUID.substring(0, 8) + '...', time_remaining: 30});
+    }
+
+    // Listen for lock and row changes pushed by the server
+    function connectEvents() {
+        eventSource = new EventSource('/api/events');
+
+        eventSource.addEventListener('open', function() {
+            setPollRates(SLOW_STATUS_POLL, SLOW_SYNC_POLL);
+        });
+
+        eventSource.addEventListener('error', function() {
+            // EventSource reconnects by itself; poll quickly in the meantime
+            setPollRates(FAST_STATUS_POLL, FAST_SYNC_POLL);
+        });
+
+        eventSource.addEventListener('session', function(e) {
+            setLockState(JSON.parse(e.data));
+        });
+
+        eventSource.addEventListener('leases', function(e) {
+            setLeases(JSON.parse(e.data).leases);
+        });
+
+        eventSource.addEventListener('rows', function(e) {
+            if (isEditing) return;
+            applyChangedRows(JSON.parse(e.data).changed);
+        });
+    }
+
+    // (Re)start the status and sync polls at the given intervals
+    function setPollRates(statusInterval, syncRate) {
+        if (statusPollInterval) clearInterval(statusPollInterval);
+        if (syncInterval) clearInterval(syncInterval);
+        statusPollInterval = setInterval(checkSessionStatus, statusInterval);
+        syncInterval = setInterval(syncChanges, syncRate);
+    }
+
     // Start editing session
     async function startEditingSession() {
         try {
@@ -190,7 +604,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 isEditing = true;
                 initializeTable(false); // Switch to editable mode
                 startKeepalive();
-                updateSessionUI({can_edit: true});
+                setOwnLockState();
                 showToast('You are now editing the spreadsheet', 'success');
             } else {
                 showToast(result.message || 'Cannot start editing session', 'warning');
@@ -219,6 +633,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 // Session is invalid or we lost editing rights
                 endEditingSession();
                 showToast(result.message || 'Session expired', 'warning');
+            } else {
+                setOwnLockState();
             }
         } catch (error) {
             console.error('Failed to extend editing session:', error);
@@ -227,6 +643,12 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // End editing session
     async function endEditingSession() {
+        // Save anything still waiting to be sent
+        if (flushTimer) {
+            clearTimeout(flushTimer);
+            await flushEdits();
+        }
+
         try {
             await fetch('/api/session/end', {
                 method: 'POST',
@@ -242,21 +664,29 @@ document.addEventListener('DOMContentLoaded', function() {
         isEditing = false;
         stopKeepalive();
         initializeTable(true); // Switch back to read-only mode
+        setLeases(otherLeases); // Ending the session also releases our leases
         updateSessionUI({can_edit: false});
     }
 
     // Send keepalive to detect client disappearance
     async function sendKeepalive() {
-        if (!isEditing) return;
+        if (!isEditing && myLeases.length === 0) return;
 
         try {
-            await fetch('/api/session/keepalive', {
+            const response = await fetch('/api/session/keepalive', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
                 body: JSON.stringify({uuid: sessionUUID})
             });
+            const result = await response.json();
+            if (result.success && isEditing) {
+                setOwnLockState();
+            } else if (!result.success && myLeases.length) {
+                setLeases(otherLeases);
+                showToast('Your row leases expired', 'warning');
+            }
         } catch (error) {
             console.error('Failed to send keepalive:', error);
         }
@@ -369,7 +799,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // Initialize the application
-    function initializeApp() {
+    async function initializeApp() {
         // Generate UUID for this browser tab
         sessionUUID = generateUUID();
         console.log('Generated session UUID:', sessionUUID);
@@ -383,32 +813,57 @@ document.addEventListener('DOMContentLoaded', function() {
                 <small>You are editing. Time remaining: <span id="time-remaining">30</span>s</small>
                 <button id="end-edit-button" class="btn btn-warning btn-sm ms-2">Stop Editing</button>
             </div>
+            <div id="lease-info" class="mt-2" style="display: none;">
+                <small>You are editing the highlighted rows. Double-click another row to edit it too.</small>
+                <button id="release-rows-button" class="btn btn-warning btn-sm ms-2">Release Rows</button>
+            </div>
         `;
 
         // Add event listeners
         document.getElementById('edit-button').addEventListener('click', startEditingSession);
         document.getElementById('end-edit-button').addEventListener('click', endEditingSession);
+        document.getElementById('release-rows-button').addEventListener('click', releaseLeases);
+        document.getElementById('export-csv-button').addEventListener('click', () => exportSheet('csv'));
+        document.getElementById('export-xlsx-button').addEventListener('click', () => exportSheet('xlsx'));
 
-        // Initialize table in read-only mode
+        // Initialize table in read-only mode, once we know its columns
+        try {
+            await loadColumns();
+        } catch (error) {
+            console.error('Failed to load columns:', error);
+            document.getElementById('status-text').textContent = 'Failed to load the sheet. Please reload the page.';
+            return;
+        }
         initializeTable(true);
 
-        // Start polling for session status
-        statusPollInterval = setInterval(checkSessionStatus, 3000); // Every 3 seconds
+        // Poll for session status and other people's edits until the event stream connects
+        setPollRates(FAST_STATUS_POLL, FAST_SYNC_POLL);
         checkSessionStatus(); // Initial check
+        connectEvents();
+
+        // Count down the lock locally
+        lockTicker = setInterval(refreshLockState, 1000);
     }
 
     // Cleanup on page unload
     window.addEventListener('beforeunload', function() {
-        if (isEditing) {
+        if (isEditing || myLeases.length) {
             // Try to end session, but don't wait for response
             fetch('/api/session/end', {
                 method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({uuid: sessionUUID}),
                 keepalive: true // Send even during page unload
             }).catch(() => {}); // Ignore errors during unload
         }
 
         if (keepaliveInterval) clearInterval(keepaliveInterval);
         if (statusPollInterval) clearInterval(statusPollInterval);
+        if (syncInterval) clearInterval(syncInterval);
+        if (lockTicker) clearInterval(lockTicker);
+        if (eventSource) eventSource.close();
     });
 
     // Start the application
@@ -0,0 +1,58 @@
+"""
+Static file storage for production.
+
+collectstatic gives every file a content hash in its name, so the web
+server can let browsers cache them forever, and writes .gz (and, if the
+brotli package is installed, .br) copies of the text files next to them, so
+the web server can send those without compressing on every request.  With
+nginx:
+
+    location /static/ {
+        alias /var/www/register-static/;
+        gzip_static on;
+        brotli_static on;  # needs ngx_brotli
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+"""
+
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".map", ".svg", ".json", ".txt", ".html", ".xml", ".ico")
+
+# Copies that save less than this aren't worth the web server's stat() calls
+MIN_SAVING = 0.05
+
+
+def compressed_variants(content):
+    """(suffix, bytes) for each compressed copy of content worth keeping"""
+    variants = [(".gz", gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(content)))
+    return [(suffix, data) for suffix, data in variants if len(data) < len(content) * (1 - MIN_SAVING)]
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(self.hashed_files.values())):
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                self.write_compressed(name)
+
+    def write_compressed(self, name):
+        with self.open(name) as file:
+            content = file.read()
+        for suffix, data in compressed_variants(content):
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(data))
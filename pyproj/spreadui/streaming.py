@@ -0,0 +1,107 @@
+import csv
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+# Columns sent to the sheet, in the order they are serialised
+PERSON_FIELDS = ("id", "first_name", "last_name", "email", "age")
+
+DEFAULT_CHUNK_SIZE = 2000
+
+_encode = json.JSONEncoder(separators=(",", ":")).encode
+
+_DONE = object()
+
+
+def iter_rows(queryset, fields=PERSON_FIELDS, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield bare value tuples for queryset.
+
+    No model instances are built, and the iterator fetches chunk_size rows at a
+    time (using a server-side cursor where the database supports one) so memory
+    use does not grow with the size of the table.
+    """
+    return queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+async def aiter_chunks(chunks):
+    """
+    Yield from the sync iterator chunks in async code, making each chunk in a
+    thread.  They are all made in the same thread, as a database cursor needs.
+    """
+    chunks = iter(chunks)
+    fetch = sync_to_async(next)
+    try:
+        while (chunk := await fetch(chunks, _DONE)) is not _DONE:
+            yield chunk
+    finally:
+        # Release the cursor if the client went away part way through
+        if hasattr(chunks, "close"):
+            await sync_to_async(chunks.close)()
+
+
+def streaming_content(request, chunks):
+    """
+    chunks, in the form the server handling request can stream.
+
+    Under ASGI, Django collects a sync iterator into a list before sending
+    any of it, so there the chunks are handed over as an async iterator.
+    Under WSGI it does the same to an async iterator, so they are left as they are.
+    """
+    return aiter_chunks(chunks) if isinstance(request, ASGIRequest) else chunks
+
+
+def _encoded_batches(rows, fields, batch):
+    """Encode each row as a JSON object, grouping them into lists of up to batch strings"""
+    encoded = []
+    for row in rows:
+        encoded.append(_encode(dict(zip(fields, row))))
+        if len(encoded) >= batch:
+            yield encoded
+            encoded = []
+    if encoded:
+        yield encoded
+
+
+def ndjson_chunks(rows, fields=PERSON_FIELDS, batch=DEFAULT_CHUNK_SIZE):
+    """Encode rows as newline-delimited JSON, yielding a string every batch rows"""
+    for encoded in _encoded_batches(rows, fields, batch):
+        yield "\n".join(encoded) + "\n"
+
+
+def json_array_chunks(rows, fields=PERSON_FIELDS, batch=DEFAULT_CHUNK_SIZE):
+    """Encode rows as a single JSON array, yielding a string every batch rows"""
+    yield "["
+    separator = ""
+    for encoded in _encoded_batches(rows, fields, batch):
+        yield separator + ",".join(encoded)
+        separator = ","
+    yield "]"
+
+
+class _LineBuffer:
+    """A file-like object that collects what csv.writer writes, for handing out in chunks"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def take(self):
+        text = "".join(self.parts)
+        self.parts = []
+        return text
+
+
+def csv_chunks(rows, fields=PERSON_FIELDS, batch=DEFAULT_CHUNK_SIZE):
+    """Encode rows as CSV with a header line, yielding a string every batch rows"""
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if i % batch == 0:
+            yield buffer.take()
+    yield buffer.take()
@@ -0,0 +1,85 @@
+from datetime import timedelta
+
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Person, PersonTombstone
+from .streaming import PERSON_FIELDS
+
+# updated_at is stamped when a row is saved, but the row only becomes visible
+# when its transaction commits.  Re-scanning a short window before the
+# watermark catches rows that committed after the previous sync ran; clients
+# apply changes idempotently, so seeing a row twice is harmless.
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# Tombstones older than this may have been swept away, so a client whose
+# watermark is older must reload the whole table instead.
+TOMBSTONE_RETENTION = timedelta(days=1)
+
+# Past this many changed or deleted rows (eg: after an import) the client is
+# told to reload the table rather than sent them all in one response
+MAX_CHANGES = 1000
+
+
+def issue_watermark():
+    return timezone.now().isoformat()
+
+
+def parse_watermark(watermark):
+    """Parse a watermark produced by issue_watermark(), raising ValueError if it is malformed"""
+    since = parse_datetime(watermark)
+    if since is None or timezone.is_naive(since):
+        raise ValueError("Invalid watermark")
+    return since
+
+
+def changes_since(since):
+    """
+    Return (watermark, changed_rows, deleted_ids, reset) for everything that
+    happened after since.  If reset is True the watermark is too old to sync
+    from, or more than MAX_CHANGES rows changed, and the client should reload
+    the table.
+    """
+    watermark = issue_watermark()
+    if since < timezone.now() - TOMBSTONE_RETENTION:
+        return watermark, [], [], True
+
+    window_start = since - SYNC_OVERLAP
+    # One more than the limit, to tell whether it was exceeded
+    changed = list(
+        Person.objects.filter(updated_at__gt=window_start).order_by("id").values(*PERSON_FIELDS)[: MAX_CHANGES + 1]
+    )
+    deleted = list(
+        PersonTombstone.objects.filter(deleted_at__gt=window_start)
+        .values_list("person_id", flat=True)
+        .distinct()[: MAX_CHANGES + 1]
+    )
+    if len(changed) > MAX_CHANGES or len(deleted) > MAX_CHANGES:
+        return watermark, [], [], True
+    return watermark, changed, deleted, False
+
+
+def people_etag():
+    """
+    A validator for the current contents of the Person table.
+
+    Every insert or update moves max(updated_at) and every delete adds a
+    tombstone, so together they change whenever the table does.  Both are
+    index lookups, which keeps conditional requests cheap however big the
+    table grows.
+    """
+    latest_update = Person.objects.aggregate(latest=Max("updated_at"))["latest"]
+    latest_tombstone = PersonTombstone.objects.aggregate(latest=Max("id"))["latest"]
+    return _etag(latest_update, latest_tombstone)
+
+
+async def apeople_etag():
+    latest_update = (await Person.objects.aaggregate(latest=Max("updated_at")))["latest"]
+    latest_tombstone = (await PersonTombstone.objects.aaggregate(latest=Max("id")))["latest"]
+    return _etag(latest_update, latest_tombstone)
+
+
+def _etag(latest_update, latest_tombstone):
+    stamp = latest_update.timestamp() if latest_update else 0
+    return f'"{stamp}-{latest_tombstone or 0}"'
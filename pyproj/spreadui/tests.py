@@ -1,3 +1,1035 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import time
+import zipfile
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import ANY, patch
 
-# Create your tests here.
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import NotSupportedError, connection
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from ninja.renderers import JSONRenderer
+
+from .api import api
+from .cache import people_cache_key, response_cache
+from .edits import update_person_fields
+from .events import Broadcaster
+from .factories import PersonFactory
+from .leases import acquire_lease, leased_ranges
+from .locks import SESSION_TIMEOUT, CacheLockBackend, DatabaseLockBackend, RedisLockBackend, get_lock_backend
+from .metrics import LOCK_EVENTS
+from .middleware import ReplicaStickinessMiddleware
+from .models import EditingSession, Person, RowLease
+from .pagination import encode_cursor
+from .renderers import ORJSONRenderer
+from .routers import STICKY_COOKIE, ReadState, ReplicaRouter, read_state, sticky_seconds
+
+
+@pytest.fixture
+def api_client(client, django_user_model):
+    user = django_user_model.objects.create(email='viewer@example.com')
+    client.force_login(user)
+    return client
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    # Cached responses would otherwise outlive the rows each test rolls back
+    response_cache().clear()
+
+
+def fetch_all_pages(api_client, sort, size):
+    ids = []
+    after = None
+    while True:
+        params = {'sort': sort, 'size': size}
+        if after:
+            params['after'] = after
+        response = api_client.get('/api/people/page', params)
+        assert response.status_code == 200
+        page = response.json()
+        ids.extend(row['id'] for row in page['data'])
+        after = page['next_cursor']
+        if not after:
+            return ids
+
+
+def test_people_page_walks_whole_table_by_id(api_client, db):
+    people = PersonFactory.create_batch(7)
+
+    ids = fetch_all_pages(api_client, 'id', 3)
+
+    assert ids == [p.id for p in people]
+
+
+def test_people_page_walks_ties_in_sort_key(api_client, db):
+    # Several people share an age, so the cursor must break ties on id
+    for age in (30, 20, 30, 20, 30, 40):
+        PersonFactory(age=age)
+
+    ids = fetch_all_pages(api_client, '-age', 2)
+
+    expected = list(Person.objects.order_by('-age', '-id').values_list('id', flat=True))
+    assert ids == expected
+
+
+def test_people_page_rejects_bad_cursor(api_client, db):
+    response = api_client.get('/api/people/page', {'after': 'not-a-cursor'})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('value', [[1], {'a': 1}])
+def test_people_page_rejects_cursor_with_non_scalar_value(api_client, db, value):
+    PersonFactory.create_batch(3)
+    response = api_client.get('/api/people/page', {'sort': 'age', 'after': encode_cursor(value, 2)})
+    assert response.status_code == 400
+
+
+def test_people_page_rejects_unknown_sort(api_client, db):
+    response = api_client.get('/api/people/page', {'sort': 'created_at'})
+    assert response.status_code == 400
+
+
+def test_people_page_applies_tabulator_sort_and_filters(api_client, db):
+    for last_name, age in (('Smith', 30), ('Smithers', 20), ('Jones', 25), ('Smith', 40)):
+        PersonFactory(last_name=last_name, age=age)
+
+    response = api_client.get('/api/people/page', {
+        'sort[0][field]': 'age', 'sort[0][dir]': 'desc',
+        'filter[0][field]': 'last_name', 'filter[0][type]': 'starts', 'filter[0][value]': 'Smi',
+        'filter[1][field]': 'age', 'filter[1][type]': '<', 'filter[1][value]': '35',
+    })
+
+    assert [row['age'] for row in response.json()['data']] == [30, 20]
+
+
+def test_starts_filter_ignores_case(api_client, db):
+    # As Tabulator's own "starts" does
+    smith = PersonFactory(last_name='Smith')
+    PersonFactory(last_name='Jones')
+
+    response = api_client.get('/api/people/page', {
+        'filter[0][field]': 'last_name', 'filter[0][type]': 'starts', 'filter[0][value]': 'smi',
+    })
+
+    assert [row['id'] for row in response.json()['data']] == [smith.id]
+
+
+@pytest.mark.parametrize('param, value', [
+    ('filter[0][field]', 'created_at'),
+    ('sort[0][field]', 'created_at'),
+])
+def test_people_page_rejects_unknown_tabulator_fields(api_client, db, param, value):
+    response = api_client.get('/api/people/page', {param: value, 'filter[0][value]': 'x'})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('size', [0, 1, 5])
+def test_people_stream_json_matches_list(api_client, db, size):
+    PersonFactory.create_batch(size)
+
+    response = api_client.get('/api/people/stream', {'chunk_size': 2})
+    streamed = json.loads(b''.join(response.streaming_content))
+
+    assert streamed == api_client.get('/api/people').json()
+
+
+def test_people_stream_is_async_under_asgi(async_client, django_user_model, db):
+    # Django would collect a sync iterator into a list before sending any of it
+    PersonFactory.create_batch(3)
+    async_client.force_login(django_user_model.objects.create(email='viewer@example.com'))
+
+    async def download():
+        response = await async_client.get('/api/people/stream', {'format': 'ndjson', 'chunk_size': 2})
+        assert response.is_async
+        return [chunk async for chunk in response.streaming_content]
+
+    chunks = async_to_sync(download)()
+
+    assert len(chunks) == 2
+    assert [json.loads(line)['id'] for line in b''.join(chunks).splitlines()] == list(
+        Person.objects.order_by('id').values_list('id', flat=True)
+    )
+
+
+def test_people_stream_ndjson(api_client, db):
+    people = PersonFactory.create_batch(3)
+
+    response = api_client.get('/api/people/stream', {'format': 'ndjson', 'chunk_size': 2})
+    lines = b''.join(response.streaming_content).decode().splitlines()
+
+    assert response['Content-Type'] == 'application/x-ndjson'
+    assert [json.loads(line)['id'] for line in lines] == [p.id for p in people]
+
+
+def test_people_fields_projection_narrows_query_and_payload(api_client, db):
+    for age in (40, 20, 30):
+        PersonFactory(age=age)
+
+    with CaptureQueriesContext(connection) as queries:
+        page = api_client.get('/api/people/page', {'fields': 'first_name', 'sort': 'age', 'size': 2}).json()
+    assert [set(row) for row in page['data']] == [{'id', 'first_name'}] * 2
+    select = next(q['sql'] for q in queries if 'FROM "spreadui_person"' in q['sql'])
+    assert '"email"' not in select
+
+    rest = api_client.get('/api/people/page', {'fields': 'first_name', 'sort': 'age', 'after': page['next_cursor']})
+    assert len(rest.json()['data']) == 1
+
+    listed = api_client.get('/api/people', {'fields': 'age'}).json()
+    assert sorted(row['age'] for row in listed) == [20, 30, 40]
+    streamed = api_client.get('/api/people/stream', {'format': 'ndjson', 'fields': 'email,age'})
+    assert set(json.loads(b''.join(streamed.streaming_content).splitlines()[0])) == {'id', 'email', 'age'}
+    assert api_client.get('/api/people/page', {'fields': 'salary'}).status_code == 400
+
+    # The documented rows only promise id
+    schemas = api.get_openapi_schema(path_prefix='/api/')['components']['schemas']
+    assert schemas['PersonRowSchema']['required'] == ['id']
+
+
+def test_people_columns_describe_the_sheet(api_client, db):
+    columns = {column['field']: column for column in api_client.get('/api/people/columns').json()}
+
+    assert list(columns) == ['id', 'first_name', 'last_name', 'email', 'age']
+    assert columns['id'] == {
+        'field': 'id', 'title': 'ID', 'type': 'integer', 'editable': False, 'sortable': True, 'filter': '=',
+    }
+    assert columns['first_name']['title'] == 'First Name'
+    assert columns['email']['editable'] and columns['email']['filter'] == 'starts'
+
+
+def test_people_list_etag(api_client, db):
+    person = PersonFactory()
+
+    response = api_client.get('/api/people')
+    etag = response['ETag']
+    assert api_client.get('/api/people', HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    person.age += 1
+    person.save()
+    response = api_client.get('/api/people', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+    etag = response['ETag']
+    person.delete()
+    assert api_client.get('/api/people', HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+def test_people_list_served_from_cache_until_table_changes(api_client, db):
+    person = PersonFactory(first_name='Ada')
+    first = api_client.get('/api/people')
+
+    with CaptureQueriesContext(connection) as queries:
+        again = api_client.get('/api/people')
+    assert not [q for q in queries if 'spreadui_person' in q['sql']]
+    assert again.content == first.content
+    assert again['ETag'] == first['ETag']
+
+    person.first_name = 'Grace'
+    person.save()
+    assert api_client.get('/api/people').json()[0]['first_name'] == 'Grace'
+
+
+def test_people_page_cache_follows_bulk_writes(api_client, db):
+    people = PersonFactory.create_batch(3, age=20)
+    assert api_client.get('/api/people/page', {'size': 2}).json()['data'][0]['age'] == 20
+    with CaptureQueriesContext(connection) as queries:
+        api_client.get('/api/people/page', {'size': 2})
+    assert not [q for q in queries if 'spreadui_person' in q['sql']]
+    # Different parameters are cached separately
+    assert len(api_client.get('/api/people/page', {'size': 3}).json()['data']) == 3
+
+    get_lock_backend().acquire('editor-a')
+    rows = [{'id': p.id, 'age': 30} for p in people]
+    api_client.post('/api/people/bulk', {'uuid': 'editor-a', 'rows': rows}, content_type='application/json')
+    assert api_client.get('/api/people/page', {'size': 2}).json()['data'][0]['age'] == 30
+
+
+def test_api_responses_are_gzipped_and_keep_weak_etags(api_client, db):
+    PersonFactory.create_batch(20)
+
+    response = api_client.get('/api/people', HTTP_ACCEPT_ENCODING='gzip')
+
+    assert response['Content-Encoding'] == 'gzip'
+    assert len(json.loads(gzip.decompress(response.content))) == 20
+    assert response['ETag'].startswith('W/')
+    assert api_client.get('/api/people', HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+    assert not api_client.get('/', HTTP_ACCEPT_ENCODING='gzip').has_header('Content-Encoding')
+
+
+def test_collectstatic_writes_hashed_and_compressed_files(settings, tmp_path):
+    settings.STATIC_ROOT = tmp_path
+    settings.STORAGES = {
+        **settings.STORAGES,
+        'staticfiles': {'BACKEND': 'spreadui.storage.CompressedManifestStaticFilesStorage'},
+    }
+
+    call_command('collectstatic', '--noinput', stdout=io.StringIO())
+
+    manifest = json.loads((tmp_path / 'staticfiles.json').read_text())
+    hashed = tmp_path / manifest['paths']['spreadui/js/tabulator-app.js']
+    assert hashed.name != 'tabulator-app.js'
+    assert gzip.decompress((tmp_path / f'{hashed}.gz').read_bytes()) == hashed.read_bytes()
+
+
+def test_people_changes_since_watermark(api_client, db):
+    kept, edited, removed = PersonFactory.create_batch(3)
+    watermark = api_client.get('/api/people/changes').json()['watermark']
+
+    # Everything before the watermark falls inside the overlap window, so age it
+    Person.objects.update(updated_at=timezone.now() - timezone.timedelta(minutes=1))
+    edited.first_name = 'Changed'
+    edited.save()
+    removed_id = removed.id
+    removed.delete()
+
+    changes = api_client.get('/api/people/changes', {'since': watermark}).json()
+
+    assert [row['id'] for row in changes['changed']] == [edited.id]
+    assert changes['changed'][0]['first_name'] == 'Changed'
+    assert changes['deleted'] == [removed_id]
+    assert not changes['reset']
+    assert changes['watermark'] > watermark
+
+
+def test_people_changes_past_the_cap_ask_for_a_reload(api_client, db, monkeypatch):
+    monkeypatch.setattr('spreadui.sync.MAX_CHANGES', 2)
+    watermark = api_client.get('/api/people/changes').json()['watermark']
+    PersonFactory.create_batch(3)
+
+    changes = api_client.get('/api/people/changes', {'since': watermark}).json()
+
+    assert changes['reset']
+    assert changes['changed'] == []
+
+
+def test_people_changes_rejects_bad_watermark(api_client, db):
+    response = api_client.get('/api/people/changes', {'since': 'yesterday'})
+    assert response.status_code == 400
+
+
+def test_broadcaster_delivers_events_published_from_other_threads():
+    broadcaster = Broadcaster()
+
+    async def listen():
+        stream = broadcaster.subscribe([': hello\n\n'])
+        assert await anext(stream) == ': hello\n\n'
+        # Publish from a handler thread while the stream waits for its next message
+        waiting = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        await asyncio.to_thread(broadcaster.publish, 'rows', {'changed': [{'id': 1}]})
+        message = await asyncio.wait_for(waiting, 1)
+        await stream.aclose()
+        return message
+
+    message = asyncio.run(listen())
+
+    assert message == 'event: rows\ndata: {"changed":[{"id":1}]}\n\n'
+    assert not broadcaster._subscribers
+
+
+def test_events_are_not_streamed_under_wsgi(api_client, db):
+    # A stream would hold the worker thread until the tab closed
+    response = api_client.get('/api/events')
+    assert response.status_code == 204
+    assert not response.streaming
+
+
+@pytest.fixture(
+    params=['spreadui.locks.DatabaseLockBackend', 'spreadui.locks.CacheLockBackend', 'spreadui.locks.RedisLockBackend']
+)
+def lock_backend(request, settings, db, monkeypatch):
+    settings.SPREADUI_LOCK_BACKEND = request.param
+    if request.param.endswith('RedisLockBackend'):
+        fake_redis(settings, monkeypatch)
+    backend = get_lock_backend()
+    yield backend
+    if isinstance(backend, CacheLockBackend):
+        backend.cache.delete(backend.key)
+
+
+def fake_redis(settings, monkeypatch):
+    """Point RedisLockBackend at an in-process Redis, or skip if there isn't one to use"""
+    fakeredis = pytest.importorskip('fakeredis')
+    # For the Lua scripts
+    pytest.importorskip('lupa')
+    client = fakeredis.FakeRedis()
+    settings.SPREADUI_LOCK_REDIS_URL = 'redis://localhost:6379/0'
+    monkeypatch.setattr('spreadui.locks.redis_client', lambda url: client)
+    return client
+
+
+def test_redis_lock_lapses_and_is_taken_over(settings, monkeypatch):
+    client = fake_redis(settings, monkeypatch)
+    backend = RedisLockBackend()
+
+    assert backend.acquire('editor-a')
+    assert client.get(backend.key) == b'editor-a'
+    assert 0 < client.pttl(backend.key) <= SESSION_TIMEOUT * 1000
+
+    client.pexpire(backend.key, 1)
+    time.sleep(0.01)
+    assert backend.status() == (None, None)
+    assert not backend.keepalive('editor-a')
+    assert backend.acquire('editor-b')
+    # editor-a's late release must not drop editor-b's lock
+    assert not backend.release('editor-a')
+    assert backend.status()[0] == 'editor-b'
+
+
+def test_lock_backend_single_editor(lock_backend):
+    assert lock_backend.status() == (None, None)
+
+    assert lock_backend.acquire('editor-a')
+    assert not lock_backend.acquire('editor-b')
+    assert not lock_backend.keepalive('editor-b')
+    assert not lock_backend.release('editor-b')
+
+    holder, time_remaining = lock_backend.status()
+    assert holder == 'editor-a'
+    assert 0 < time_remaining <= SESSION_TIMEOUT
+
+    assert lock_backend.keepalive('editor-a')
+    assert lock_backend.acquire('editor-a')
+    assert lock_backend.release('editor-a')
+    assert lock_backend.acquire('editor-b')
+
+
+def test_session_api_flow(api_client, lock_backend):
+    def post(path, uuid):
+        return api_client.post(path, {'uuid': uuid}, content_type='application/json').json()
+
+    assert post('/api/session/edit', 'editor-a')['can_edit']
+    assert not post('/api/session/edit', 'editor-b')['can_edit']
+
+    status = api_client.get('/api/session/status', {'uuid': 'editor-b'}).json()
+    assert not status['can_edit']
+    assert status['current_editor'] == 'editor-a...'
+
+    assert post('/api/session/keepalive', 'editor-a')['success']
+    assert post('/api/session/end', 'editor-a')['success']
+    assert api_client.get('/api/session/status', {'uuid': 'editor-b'}).json()['can_edit']
+
+
+def test_database_lock_uses_one_statement_per_call(db, django_assert_num_queries):
+    backend = DatabaseLockBackend()
+    backend.acquire('editor-a')
+
+    for call in (backend.status, lambda: backend.acquire('editor-a'), lambda: backend.keepalive('editor-a')):
+        with django_assert_num_queries(1):
+            call()
+    with django_assert_num_queries(1):
+        assert backend.release('editor-a')
+    # A released lock is claimed by overwriting the row
+    with django_assert_num_queries(1):
+        assert backend.acquire('editor-b')
+
+
+def test_database_lock_takes_over_lapsed_session(db):
+    backend = DatabaseLockBackend()
+    backend.acquire('editor-a')
+    EditingSession.objects.update(last_keepalive=timezone.now() - timezone.timedelta(seconds=SESSION_TIMEOUT + 1))
+
+    assert backend.status() == (None, None)
+    assert not backend.keepalive('editor-a')
+    assert backend.acquire('editor-b')
+    assert EditingSession.objects.get().uuid == 'editor-b'
+
+
+def test_session_status_never_writes(db, django_assert_num_queries):
+    backend = DatabaseLockBackend()
+    backend.acquire('editor-a')
+    EditingSession.objects.update(last_keepalive=timezone.now() - timezone.timedelta(seconds=SESSION_TIMEOUT + 1))
+
+    with django_assert_num_queries(1) as captured:
+        assert backend.status() == (None, None)
+    assert captured.captured_queries[0]['sql'].startswith('SELECT')
+    assert EditingSession.objects.exists()
+
+    assert backend.sweep() == 1
+    assert not EditingSession.objects.exists()
+
+
+def test_bulk_update_applies_patches_in_few_queries(api_client, db, django_assert_max_num_queries):
+    people = PersonFactory.create_batch(50, age=20)
+    get_lock_backend().acquire('editor-a')
+    rows = [{'id': p.id, 'age': 30} for p in people] + [{'id': people[0].id, 'first_name': 'Pasted'}]
+
+    with django_assert_max_num_queries(10):
+        response = api_client.post(
+            '/api/people/bulk', {'uuid': 'editor-a', 'rows': rows}, content_type='application/json'
+        )
+
+    result = response.json()
+    assert result['success']
+    assert len(result['results']) == 50
+    assert set(Person.objects.values_list('age', flat=True)) == {30}
+    first = Person.objects.get(id=people[0].id)
+    assert first.first_name == 'Pasted'
+    assert first.updated_at > people[0].updated_at
+
+
+def test_overlapping_bulk_saves_keep_each_others_columns(api_client, db):
+    person = PersonFactory(first_name='Ann', email='ann@example.com')
+    other = PersonFactory()
+    get_lock_backend().acquire('editor-a')
+
+    def bulk(rows):
+        return api_client.post('/api/people/bulk', {'uuid': 'editor-a', 'rows': rows}, content_type='application/json')
+
+    # Another save changes person's email after this one has read the row
+    in_bulk = QuerySet.in_bulk
+
+    def read_then_race(queryset, *args, **kwargs):
+        people = in_bulk(queryset, *args, **kwargs)
+        Person.objects.filter(id=person.id).update(email='new@example.com')
+        return people
+
+    with patch.object(QuerySet, 'in_bulk', read_then_race):
+        response = bulk([{'id': person.id, 'first_name': 'Anna'}, {'id': other.id, 'email': 'other@example.com'}])
+    assert response.json()['success']
+
+    person.refresh_from_db()
+    assert (person.first_name, person.email) == ('Anna', 'new@example.com')
+    assert Person.objects.get(id=other.id).email == 'other@example.com'
+
+
+def test_bulk_update_reports_per_row_failures(api_client, db):
+    person = PersonFactory(age=20)
+    get_lock_backend().acquire('editor-a')
+    rows = [{'id': person.id, 'age': 21}, {'id': person.id + 1000, 'age': 22}, {'id': person.id, 'age': -1}]
+
+    result = api_client.post(
+        '/api/people/bulk', {'uuid': 'editor-a', 'rows': rows}, content_type='application/json'
+    ).json()
+
+    # The two patches to person are merged, so the negative age is what fails
+    assert not result['success']
+    assert [r['success'] for r in result['results']] == [False, False]
+    person.refresh_from_db()
+    assert person.age == 20
+
+
+def test_edits_are_validated_like_imports(api_client, db):
+    person = PersonFactory(first_name='Ann', age=20)
+    other = PersonFactory()
+    get_lock_backend().acquire('editor-a')
+    # A cleared cell is refused rather than silently left as it was
+    rows = [{'id': person.id, 'age': None}, {'id': other.id, 'first_name': 'x' * 300}]
+
+    result = api_client.post(
+        '/api/people/bulk', {'uuid': 'editor-a', 'rows': rows}, content_type='application/json'
+    ).json()
+    patched = api_client.patch(
+        f'/api/people/{person.id}', {'uuid': 'editor-a', 'email': 'nope'}, content_type='application/json'
+    ).json()
+
+    assert [r['message'] for r in result['results']] == [
+        'age is required', 'first_name is longer than 100 characters'
+    ]
+    assert patched == {'success': False, 'message': "'nope' is not a valid email address"}
+    person.refresh_from_db()
+    assert (person.first_name, person.age) == ('Ann', 20)
+
+
+def test_bulk_update_requires_lock(api_client, db):
+    person = PersonFactory()
+    result = api_client.post(
+        '/api/people/bulk', {'uuid': 'nobody', 'rows': [{'id': person.id, 'age': 1}]}, content_type='application/json'
+    ).json()
+    assert not result['success']
+    assert result['message'] == 'Invalid session'
+
+
+def test_update_person_fields_writes_only_changed_columns(db, django_assert_num_queries):
+    person = PersonFactory(first_name='Ann', age=20)
+
+    with django_assert_num_queries(2) as captured:
+        _, changed = update_person_fields(person.id, {'age': 21, 'first_name': 'Ann'})
+    assert changed == ['age']
+    update = captured.captured_queries[-1]['sql']
+    assert '"age"' in update and '"updated_at"' in update
+    assert '"first_name"' not in update and '"email"' not in update
+
+    # No UPDATE at all when nothing changed
+    with django_assert_num_queries(1):
+        assert update_person_fields(person.id, {'age': 21}) == (ANY, [])
+
+
+def test_patch_person(api_client, db):
+    person = PersonFactory(first_name='Ann', age=20)
+    get_lock_backend().acquire('editor-a')
+
+    result = api_client.patch(
+        f'/api/people/{person.id}', {'uuid': 'editor-a', 'age': 21}, content_type='application/json'
+    ).json()
+
+    assert result == {'success': True, 'changed': ['age']}
+    person.refresh_from_db()
+    assert (person.first_name, person.age) == ('Ann', 21)
+
+
+def test_put_person_still_replaces_row(api_client, db):
+    person = PersonFactory()
+    get_lock_backend().acquire('editor-a')
+
+    data = {'uuid': 'editor-a', 'first_name': 'A', 'last_name': 'B', 'email': 'a@b.co', 'age': 5}
+    assert api_client.put(f'/api/people/{person.id}', data, content_type='application/json').json()['success']
+
+    person.refresh_from_db()
+    assert (person.first_name, person.last_name, person.email, person.age) == ('A', 'B', 'a@b.co', 5)
+
+
+def test_row_leases_conflict_only_when_ranges_overlap(db):
+    assert acquire_lease('editor-a', 10, 20)
+    assert acquire_lease('editor-b', 21, 30)
+    assert acquire_lease('editor-c', 1, 9)
+
+    assert not acquire_lease('editor-d', 20, 21)
+    assert not acquire_lease('editor-d', 5, 15)
+    assert not acquire_lease('editor-d', 1, 100)
+    assert acquire_lease('editor-d', 31, 40)
+
+    # Re-leasing replaces your own overlapping leases
+    assert acquire_lease('editor-a', 12, 20)
+    assert leased_ranges('editor-a') == [(12, 20)]
+    assert acquire_lease('editor-d', 10, 11)
+
+
+def test_row_leases_ignore_lapsed_leases_and_global_lock(db):
+    assert acquire_lease('editor-a', 1, 10)
+    RowLease.objects.update(last_keepalive=timezone.now() - timezone.timedelta(seconds=SESSION_TIMEOUT + 1))
+    assert acquire_lease('editor-b', 5, 6)
+
+    get_lock_backend().acquire('editor-c')
+    assert not acquire_lease('editor-d', 20, 30)
+
+
+def test_lease_claims_fail_closed_where_they_cant_be_serialised(db, monkeypatch):
+    monkeypatch.setattr('spreadui.leases.connection', SimpleNamespace(vendor='oracle'))
+
+    with pytest.raises(NotSupportedError):
+        acquire_lease('editor-a', 1, 10)
+
+
+def test_racing_lease_and_lock_claims_back_out(api_client, db, monkeypatch):
+    # Each side checks the other after claiming, so simulate the other claim landing in between
+    class Backend:
+        statuses = iter([(None, None), ('editor-b', SESSION_TIMEOUT)])
+
+        def status(self):
+            return next(self.statuses)
+
+    with monkeypatch.context() as m:
+        m.setattr('spreadui.leases.get_lock_backend', Backend)
+        assert not acquire_lease('editor-a', 1, 10)
+    assert leased_ranges('editor-a') == []
+
+    answers = iter([False, True])
+
+    async def others_hold_leases(uuid):
+        return next(answers)
+
+    monkeypatch.setattr('spreadui.api.aothers_hold_leases', others_hold_leases)
+    result = api_client.post('/api/session/edit', {'uuid': 'editor-b'}, content_type='application/json').json()
+    assert not result['success']
+    assert get_lock_backend().status() == (None, None)
+
+
+def test_leased_row_can_be_edited_by_lease_holder_only(api_client, db):
+    first, second = PersonFactory.create_batch(2, age=20)
+
+    def post(path, data):
+        return api_client.post(path, data, content_type='application/json').json()
+
+    assert post('/api/session/lease', {'uuid': 'editor-a', 'first_id': first.id, 'last_id': first.id})['success']
+    # The whole-sheet lock can't be taken while someone holds a lease
+    assert not post('/api/session/edit', {'uuid': 'editor-b'})['success']
+
+    rows = [{'id': first.id, 'age': 30}, {'id': second.id, 'age': 30}]
+    result = post('/api/people/bulk', {'uuid': 'editor-a', 'rows': rows})
+    assert [(r['id'], r['success']) for r in result['results']] == [(second.id, False), (first.id, True)]
+
+    status = api_client.get('/api/session/status', {'uuid': 'editor-b'}).json()
+    assert status['can_edit']
+    assert status['leases'] == [{'first_id': first.id, 'last_id': first.id, 'holder': 'editor-a...'}]
+
+    assert post('/api/session/end', {'uuid': 'editor-a'})['success']
+    assert api_client.get('/api/session/status', {'uuid': 'editor-b'}).json()['leases'] == []
+
+
+def test_search_matches_word_prefixes_and_follows_edits(api_client, db):
+    smith = PersonFactory(first_name='Anna', last_name='Smith', email='anna@example.com')
+    PersonFactory(first_name='Bob', last_name='Jones', email='bob@example.com')
+
+    response = api_client.get('/api/people/search', {'q': 'smi ann'})
+    assert [row['id'] for row in response.json()['data']] == [smith.id]
+
+    # The index follows updates, bulk updates and deletes
+    update_person_fields(smith.id, {'last_name': 'Taylor'})
+    assert api_client.get('/api/people/search', {'q': 'smith'}).json()['data'] == []
+    Person.objects.filter(id=smith.id).update(last_name='Walker')
+    assert len(api_client.get('/api/people/search', {'q': 'walk'}).json()['data']) == 1
+    smith.delete()
+    assert api_client.get('/api/people/search', {'q': 'anna'}).json()['data'] == []
+
+
+def test_search_pages_through_matches(api_client, db):
+    PersonFactory.create_batch(5, last_name='Smith')
+
+    first = api_client.get('/api/people/search', {'q': 'smith', 'size': 3}).json()
+    second = api_client.get('/api/people/search', {'q': 'smith', 'size': 3, 'page': 2}).json()
+
+    assert (len(first['data']), first['has_more']) == (3, True)
+    assert (len(second['data']), second['has_more']) == (2, False)
+
+
+@pytest.mark.parametrize('page', [0, -1])
+def test_search_rejects_pages_before_the_first(api_client, db, page):
+    response = api_client.get('/api/people/search', {'q': 'smith', 'page': page})
+    assert response.status_code == 400
+
+
+def test_admin_search_uses_index(admin_client, db):
+    PersonFactory(last_name='Smith')
+    PersonFactory(last_name='Jones')
+
+    response = admin_client.get('/office/spreadui/person/', {'q': 'jon'})
+
+    assert response.context['cl'].result_count == 1
+
+
+def test_admin_estimates_unfiltered_counts_only(admin_client, db, monkeypatch):
+    for age in (25, 35, 50):
+        PersonFactory(age=age)
+    monkeypatch.setattr('spreadui.pagination.estimated_row_count', lambda model, using: 2_000_000)
+
+    unfiltered = admin_client.get('/office/spreadui/person/')
+    filtered = admin_client.get('/office/spreadui/person/', {'age': '30-44'})
+
+    assert unfiltered.context['cl'].paginator.count == 2_000_000
+    assert [p.age for p in filtered.context['cl'].result_list] == [35]
+    assert filtered.context['cl'].paginator.count == 1
+
+
+def test_admin_session_activity_is_computed_in_the_query(admin_client, db):
+    EditingSession.objects.create(uuid='tab-a')
+    stale = EditingSession.objects.create(uuid='tab-b', slot=2)
+    EditingSession.objects.filter(pk=stale.pk).update(last_keepalive=timezone.now() - timedelta(minutes=5))
+
+    response = admin_client.get('/office/spreadui/editingsession/')
+
+    assert {s.uuid: s.active for s in response.context['cl'].result_list} == {'tab-a': True, 'tab-b': False}
+
+
+IMPORT_CSV = (
+    'first_name,last_name,email,age\n'
+    'Anna,Smith,anna@example.com,30\n'
+    'Bob,Jones,not-an-email,40\n'
+    'Cara,Brown,cara@example.com,-1\n'
+    'Dan,White,dan@example.com,25\n'
+)
+
+
+def test_import_command_saves_good_rows_and_writes_rejects(db, tmp_path):
+    path = tmp_path / 'people.csv'
+    path.write_text(IMPORT_CSV)
+
+    call_command('import_people', str(path), '--batch-size', '2', stdout=io.StringIO())
+
+    assert sorted(Person.objects.values_list('first_name', flat=True)) == ['Anna', 'Dan']
+    rejects = (tmp_path / 'people.csv.rejects.csv').read_text().splitlines()
+    assert [line.split(',')[0] for line in rejects] == ['line', '3', '4']
+
+
+def test_import_updates_rows_with_ids(api_client, db):
+    person = PersonFactory(first_name='Anna')
+    api_client.post('/api/session/edit', {'uuid': 'importer'}, content_type='application/json')
+    upload = SimpleUploadedFile(
+        'people.csv',
+        (
+            'id,first_name,last_name,email,age\n'
+            f'{person.id},Annie,Smith,anna@example.com,31\n'
+            '999,X,Y,x@example.com,1\n'
+        ).encode(),
+    )
+
+    response = api_client.post('/api/people/import', {'uuid': 'importer', 'file': upload})
+
+    assert response.json() == {
+        'success': True, 'message': None, 'processed': 2, 'created': 0, 'updated': 1, 'rejected': 1,
+        'rejects': [{'line': 3, 'error': 'No person with id 999'}],
+    }
+    person.refresh_from_db()
+    assert (person.first_name, person.age) == ('Annie', 31)
+
+
+def test_import_requires_lock_and_columns(api_client, db):
+    upload = SimpleUploadedFile('people.csv', b'first_name,last_name\nAnna,Smith\n')
+
+    response = api_client.post('/api/people/import', {'uuid': 'importer', 'file': upload})
+    assert response.json()['success'] is False
+
+    api_client.post('/api/session/edit', {'uuid': 'importer'}, content_type='application/json')
+    upload.seek(0)
+    response = api_client.post('/api/people/import', {'uuid': 'importer', 'file': upload})
+    assert response.status_code == 400
+
+
+def test_import_rejects_malformed_csv(api_client, db):
+    api_client.post('/api/session/edit', {'uuid': 'importer'}, content_type='application/json')
+    body = 'first_name,last_name,email,age\n"' + 'x' * 200_000 + '",Smith,anna@example.com,30\n'
+    upload = SimpleUploadedFile('people.csv', body.encode())
+
+    response = api_client.post('/api/people/import', {'uuid': 'importer', 'file': upload})
+
+    assert response.status_code == 400
+    assert 'Not a readable CSV file' in response.json()['detail']
+
+
+def test_import_rejects_truncated_xlsx(api_client, db):
+    openpyxl = pytest.importorskip('openpyxl')
+    workbook = openpyxl.Workbook()
+    workbook.active.append(['first_name', 'last_name', 'email', 'age'])
+    workbook.active.append(['Anna', 'Smith', 'anna@example.com', 30])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    api_client.post('/api/session/edit', {'uuid': 'importer'}, content_type='application/json')
+    upload = SimpleUploadedFile('people.xlsx', buffer.getvalue()[:-100])
+
+    response = api_client.post('/api/people/import', {'uuid': 'importer', 'file': upload})
+
+    assert response.status_code == 400
+    assert response.json()['detail'] == 'Not a readable XLSX file'
+    assert not Person.objects.exists()
+
+
+def test_export_csv_applies_sort_and_filters(api_client, db):
+    PersonFactory(first_name='Anna', last_name='Smith', age=30)
+    PersonFactory(first_name='Bob', last_name='Smith', age=40)
+    PersonFactory(first_name='Cara', last_name='Jones', age=50)
+
+    response = api_client.get('/api/people/export', {
+        'format': 'csv', 'sort[0][field]': 'age', 'sort[0][dir]': 'desc',
+        'filter[0][field]': 'last_name', 'filter[0][type]': '=', 'filter[0][value]': 'Smith',
+    })
+    lines = b''.join(response.streaming_content).decode().splitlines()
+
+    assert response['Content-Disposition'] == 'attachment; filename="people.csv"'
+    assert lines[0] == 'id,first_name,last_name,email,age'
+    assert [line.split(',')[1] for line in lines[1:]] == ['Bob', 'Anna']
+
+
+def test_export_xlsx_is_a_workbook(api_client, db):
+    people = PersonFactory.create_batch(3, first_name='<Ann & Co>')
+
+    response = api_client.get('/api/people/export', {'format': 'xlsx'})
+    workbook = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+    sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+
+    assert workbook.testzip() is None
+    assert sheet.count('<row>') == 4
+    assert f'<c><v>{people[2].id}</v></c>' in sheet
+    assert '&lt;Ann &amp; Co&gt;' in sheet
+
+
+def test_export_is_async_under_asgi(async_client, django_user_model, db):
+    PersonFactory.create_batch(3)
+    async_client.force_login(django_user_model.objects.create(email='viewer@example.com'))
+
+    async def download(format):
+        response = await async_client.get('/api/people/export', {'format': format})
+        assert response.is_async
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    assert async_to_sync(download)('csv').decode().splitlines()[0] == 'id,first_name,last_name,email,age'
+    assert zipfile.ZipFile(io.BytesIO(async_to_sync(download)('xlsx'))).testzip() is None
+
+
+def test_populate_people_is_reproducible_across_workers(db):
+    PersonFactory.create_batch(3)
+
+    seeded = []
+    for workers in ('1', '2'):
+        call_command(
+            'populate_people', '25', '--batch-size', '10', '--seed', '3', '--workers', workers, stdout=io.StringIO()
+        )
+        seeded.append(list(Person.objects.order_by('id').values_list('id', 'first_name', 'last_name', 'email', 'age')))
+
+    assert len(seeded[0]) == 25
+    assert seeded[0] == seeded[1]
+    assert seeded[0][0][0] == 1
+
+
+@pytest.mark.parametrize('viewers, editors, endpoints', [
+    ('2', '0', ['GET /session/status', 'GET /people/changes', 'GET /people/page']),
+    ('0', '1', ['GET /session/status', 'POST /session/edit', 'PUT /people/{id}', 'POST /session/keepalive']),
+])
+def test_loadtest_reports_each_endpoint(transactional_db, viewers, editors, endpoints):
+    # Viewers and editors run separately here: the in-memory test database
+    # fails with "table is locked" instead of waiting when threads collide.
+    out = io.StringIO()
+
+    call_command(
+        'loadtest', '--viewers', viewers, '--editors', editors, '--iterations', '5', '--sizes', '20', stdout=out
+    )
+
+    report = out.getvalue()
+    assert '20 people' in report
+    assert 'error' not in report
+    for endpoint in endpoints:
+        assert endpoint in report
+
+
+def test_orjson_renderer_matches_default_renderer():
+    pytest.importorskip('orjson')
+    data = {'data': [{'id': 1, 'first_name': 'Zoë', 'age': 30}], 'at': timezone.now(), 'next_cursor': None}
+
+    fast = ORJSONRenderer().render(None, data, response_status=200)
+
+    assert json.loads(fast) == json.loads(JSONRenderer().render(None, data, response_status=200))
+
+
+def test_bench_render_reports_each_path():
+    out = io.StringIO()
+
+    call_command('bench_render', '--sizes', '100', '--repeat', '1', stdout=out)
+
+    assert 'schema + json' in out.getvalue()
+    assert 'values + json' in out.getvalue()
+
+
+def test_metrics_middleware_records_routes_and_lock_events(api_client, db, settings):
+    settings.API_ALLOW_IPV4_SUBNET = '127.0.0.0/24'
+    PersonFactory.create_batch(2)
+    denied = LOCK_EVENTS.value(lock='sheet', event='denied')
+
+    response = api_client.get('/api/people/page')
+    api_client.post('/api/session/edit', {'uuid': 'a'}, content_type='application/json')
+    api_client.post('/api/session/edit', {'uuid': 'b'}, content_type='application/json')
+
+    assert response['Server-Timing'].startswith('app;dur=')
+    assert 'queries"' in response['Server-Timing']
+    assert LOCK_EVENTS.value(lock='sheet', event='denied') == denied + 1
+    scrape = api_client.get('/metrics', REMOTE_ADDR='127.0.0.1').content.decode()
+    bucket = 'spreadui_request_duration_seconds_bucket{route="api/people/page",method="GET",status="200",le="+Inf"}'
+    assert bucket in scrape
+    assert 'spreadui_lock_events_total{lock="sheet",event="denied"}' in scrape
+
+
+def test_metrics_middleware_counts_queries_under_asgi(async_client, django_user_model, db):
+    # The queries run in sync_to_async() threads, on other connections
+    PersonFactory.create_batch(2)
+    async_client.force_login(django_user_model.objects.create(email='viewer@example.com'))
+
+    response = async_to_sync(async_client.get)('/api/people')
+
+    assert response.status_code == 200
+    assert 'desc="0 queries"' not in response['Server-Timing']
+    assert 'queries"' in response['Server-Timing']
+
+
+def test_metrics_endpoint_is_restricted(client, settings):
+    settings.API_ALLOW_IPV4_SUBNET = '10.0.0.0/8'
+
+    assert client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code == 403
+    assert client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code == 200
+
+
+def test_lock_backend_async_methods(lock_backend):
+    assert async_to_sync(lock_backend.aacquire)('tab-a') is True
+    assert async_to_sync(lock_backend.aacquire)('tab-b') is False
+    holder, time_remaining = async_to_sync(lock_backend.astatus)()
+    assert holder == 'tab-a' and 0 < time_remaining <= SESSION_TIMEOUT
+    assert async_to_sync(lock_backend.akeepalive)('tab-b') is False
+    assert async_to_sync(lock_backend.akeepalive)('tab-a') is True
+    assert async_to_sync(lock_backend.arelease)('tab-a') is True
+    assert async_to_sync(lock_backend.astatus)() == (None, None)
+
+
+def test_session_endpoints_serve_concurrent_async_requests(db, django_user_model):
+    user = django_user_model.objects.create(email='viewer@example.com')
+
+    async def poll():
+        client = AsyncClient()
+        await client.aforce_login(user)
+        edit = await client.post('/api/session/edit', {'uuid': 'tab-a'}, content_type='application/json')
+        statuses = await asyncio.gather(*(client.get('/api/session/status', {'uuid': 'tab-b'}) for _ in range(10)))
+        people = await client.get('/api/people')
+        return edit, statuses, people
+
+    edit, statuses, people = async_to_sync(poll)()
+
+    assert edit.json()['can_edit'] is True
+    assert {response.json()['current_editor'] for response in statuses} == {'tab-a...'}
+    assert people.status_code == 200
+
+
+def test_replica_router_sends_people_reads_to_replicas_until_the_client_writes(db, settings, rf):
+    settings.SPREADUI_READ_REPLICAS = ['replica']
+    router = ReplicaRouter()
+    person = PersonFactory()
+
+    def view(request):
+        reads = router.db_for_read(Person)
+        if request.method == 'PUT':
+            update_person_fields(person.id, {'age': person.age + 1})
+        return HttpResponse(reads)
+
+    middleware = ReplicaStickinessMiddleware(view)
+
+    viewer = middleware(rf.get('/api/people'))
+    assert viewer.content == b'replica'
+    assert STICKY_COOKIE not in viewer.cookies
+
+    editor = middleware(rf.put('/api/people/1'))
+    assert editor.cookies[STICKY_COOKIE]['max-age'] == sticky_seconds()
+    request = rf.get('/api/people')
+    request.COOKIES[STICKY_COOKIE] = '1'
+    assert middleware(request).content == b'default'
+
+    # Lock state stays on the primary
+    assert router.db_for_read(EditingSession) is None
+    assert router.db_for_read(RowLease) is None
+
+
+def test_replica_responses_are_cached_apart_from_the_primarys(settings, rf):
+    # Else a body rendered from a lagging replica could be served to a client that just wrote
+    settings.SPREADUI_READ_REPLICAS = ['replica']
+    request = rf.get('/api/people/page', {'size': 10})
+
+    token = read_state.set(ReadState())
+    try:
+        replica_key = people_cache_key(1, request)
+        read_state.get().wrote = True
+        assert people_cache_key(1, request) != replica_key
+    finally:
+        read_state.reset(token)
+
+
+def test_fast_paths_skip_unneeded_middleware_but_not_login(api_client, db):
+    status = api_client.get('/api/session/status', {'uuid': 'tab-a'})
+    assert status.status_code == 200
+    assert not status.has_header('X-Frame-Options')
+    assert api_client.get('/api/people').has_header('X-Frame-Options')
+
+    assert Client().get('/api/session/status', {'uuid': 'tab-a'}).status_code == 302
+
+
+def test_bench_middleware_reports_each_stack(db):
+    out = io.StringIO()
+
+    call_command('bench_middleware', '--requests', '3', stdout=out)
+
+    for stack in ('no middleware', 'full stack', 'fast path'):
+        assert f'/api/session/status [{stack}]' in out.getvalue()
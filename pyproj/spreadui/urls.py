@@ -7,4 +7,5 @@ app_name = "spreadui"
 urlpatterns = [
     path("", views.sheet, name="sheet"),
     path("api/", api.urls),
+    path("metrics", views.metrics, name="metrics"),
 ]
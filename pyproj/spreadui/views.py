@@ -1,9 +1,34 @@
-from django.http import HttpResponse
+import ipaddress
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render
 
 from login_required import login_not_required
 
+from .metrics import registry
+
 
 @login_not_required
 def sheet(request):
     return render(request, "spreadui/sheet.html")
+
+
+def _allowed_subnets():
+    for name in ("API_ALLOW_IPV4_SUBNET", "API_ALLOW_IPV6_SUBNET"):
+        subnet = getattr(settings, name, None)
+        if subnet:
+            yield ipaddress.ip_network(subnet)
+
+
+@login_not_required
+def metrics(request):
+    """Prometheus scrape endpoint, for staff or for clients in the API_ALLOW_*_SUBNET networks"""
+    if not request.user.is_staff:
+        try:
+            address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+        except ValueError:
+            return HttpResponseForbidden()
+        if not any(address in subnet for subnet in _allowed_subnets()):
+            return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
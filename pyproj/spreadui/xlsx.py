@@ -0,0 +1,99 @@
+"""
+A minimal constant-memory XLSX writer.
+
+An XLSX file is a zip of XML parts.  The worksheet is written as a stream of
+rows using inline strings, so there is no shared string table to build up,
+and zipfile writes to an unseekable sink using data descriptors, so the
+compressed bytes can be handed out as they are produced.  Memory use depends
+on the batch size, not on the number of rows.
+"""
+
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>"""
+
+ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>"""
+
+SHEET_START = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>"""
+
+SHEET_END = "</sheetData></worksheet>"
+
+# Characters XML 1.0 does not allow, even escaped
+_ILLEGAL_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+class _Sink:
+    """An unseekable file-like object that collects what zipfile writes"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def _cell(value):
+    if value is None:
+        return "<c/>"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c><v>{value}</v></c>"
+    text = escape(_ILLEGAL_XML.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row(values):
+    return "<row>" + "".join(_cell(value) for value in values) + "</row>"
+
+
+def xlsx_chunks(rows, fields, batch=2000, sheet_name="Sheet1"):
+    """Encode rows as an XLSX workbook with a header row, yielding bytes every batch rows"""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as workbook:
+        workbook.writestr("[Content_Types].xml", CONTENT_TYPES)
+        workbook.writestr("_rels/.rels", ROOT_RELS)
+        workbook.writestr("xl/workbook.xml", WORKBOOK.format(name=escape(sheet_name, {'"': "&quot;"})))
+        workbook.writestr("xl/_rels/workbook.xml.rels", WORKBOOK_RELS)
+
+        # force_zip64 because the size of the sheet isn't known in advance
+        with workbook.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write((SHEET_START + _row(fields)).encode())
+            encoded = []
+            for row in rows:
+                encoded.append(_row(row))
+                if len(encoded) >= batch:
+                    sheet.write("".join(encoded).encode())
+                    encoded = []
+                    yield sink.take()
+            sheet.write(("".join(encoded) + SHEET_END).encode())
+    yield sink.take()